@@ -10,7 +10,7 @@ let _db = null;
 let _conn = null;
 let _connPromise = null;
 let _attachedTimestamp = null;
-let _counter = 0;
+let _attachedTables = {}; // table name -> alias of its attached file
 
 export async function getDb() {
     if (_db) return _db;
@@ -46,13 +46,12 @@ export async function getDbConn() {
     const response = await fetch(manifestUrl);
     const manifest = await response.json();
     const newTimestamp = manifest.generated_at;
-    const db_name = manifest.db_name;
 
     if (_connPromise && _attachedTimestamp === newTimestamp) {
         return _connPromise;
     }
 
-    // timestamp changed. Refresh DB.
+    // timestamp changed. Refresh the tables that changed.
     if (_connPromise) {
         _connPromise = null;
     }
@@ -64,17 +63,23 @@ export async function getDbConn() {
         if (_conn) await _conn.close();
         const conn = await db.connect();
 
-        const attachUrl = getUrl(db_name);
-        
-        if (_counter > 0)
-            await conn.query(`DETACH DATABASE db${_counter};`).catch((e) => {
-                console.log("Error detaching previous database", e);
-            });
-        _counter++;
-        console.log(`Attaching database from ${attachUrl}`);
-        await conn.query(`ATTACH '${attachUrl}' as db${_counter} (READ_ONLY); USE db${_counter};`);
-        // const attachedDbs = await conn.query(`SHOW DATABASES`);
-        // console.log("Attached databases:", attachedDbs.toArray().map(r => r.toJSON()));
+        // Every table lives in its own file, named after its content. Only the tables whose hash
+        // changed are attached again; the others keep their attachment and cached blocks.
+        // Queries use the views in the default in-memory database.
+        for (const [table, info] of Object.entries(manifest.tables)) {
+            const alias = `${table}_${info.hash}`;
+            if (_attachedTables[table] === alias) continue;
+
+            const attachUrl = getUrl(info.file);
+            console.log(`Attaching ${table} (${info.rows} rows) from ${attachUrl}`);
+            await conn.query(`ATTACH '${attachUrl}' AS ${alias} (READ_ONLY);`);
+            await conn.query(`CREATE OR REPLACE VIEW memory.main.${table} AS FROM ${alias}.${table};`);
+            if (_attachedTables[table])
+                await conn.query(`DETACH DATABASE ${_attachedTables[table]};`).catch((e) => {
+                    console.log(`Error detaching previous ${table} database`, e);
+                });
+            _attachedTables[table] = alias;
+        }
         _conn = conn;
         return conn;
     })();
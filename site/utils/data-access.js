@@ -1,16 +1,18 @@
 import { getDbConn } from "../index.js";
 
 /**
- * Search for systems with names matching the given pattern
- * @param {string} searchPattern - Pattern to search for (will be used with ILIKE)
+ * Search for systems with names starting with the given prefix
+ * @param {string} searchPattern - Case-insensitive name prefix
  * @returns {Promise<Array>} Array of system objects with StarSystem and SystemAddress
  */
 export async function searchSystems(searchPattern) {
     const conn = await getDbConn();
+    // system_names is sorted on the lowercased name, so a prefix is a range that only touches a few row groups.
     const stmt = await conn.prepare(
-        `SELECT StarSystem,SystemAddress FROM systems WHERE LOWER(StarSystem) ILIKE ? LIMIT 20;`
+        `SELECT StarSystem,SystemAddress FROM system_names WHERE NameKey >= ? AND NameKey < ? ORDER BY NameKey LIMIT 20;`
     );
-    const result = await stmt.query(`${searchPattern}%`);
+    const prefix = searchPattern.toLowerCase();
+    const result = await stmt.query(prefix, `${prefix}\uffff`);
     return result.toArray().map(row => row.toJSON());
 }
 
@@ -22,7 +24,10 @@ export async function searchSystems(searchPattern) {
 export async function getInfraFailures(originSystemAddress) {
     const conn = await getDbConn();
     const stmt = await conn.prepare(
-        `SELECT *, round(system__address_distance(?, SystemAddress),0) AS "Distance" FROM infra_failures;`
+        `WITH origin AS (SELECT StarPos FROM systems WHERE SystemAddress = ? LIMIT 1)
+        SELECT f.* EXCLUDE (StarPos), round(array_distance(f.StarPos, origin.StarPos),0) AS "Distance"
+        FROM infra_failures f
+        LEFT JOIN origin ON true;`
     );
     const result = await stmt.query(originSystemAddress.toString());
     return result.toArray().map(row => row.toJSON());
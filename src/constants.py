@@ -8,6 +8,12 @@ SITE_DIR = "site/"
 
 DB_SITE_NAME ="sitedata"
 
+# JSON trace and OpenMetrics file of each go.py run
+DIR_TRACES = 'traces/'
+
+# DuckDB JSON profiles of the heavy statements, written by go.py --profile-sql
+DIR_SQL_PROFILES = 'profiles/'
+
 URL_BASE_EDGALAXYDATA = "https://edgalaxydata.space/EDDN/"
 URL_EDSM_SYSTEMS_POPULATED = "https://www.edsm.net/dump/systemsPopulated.json.gz"
 
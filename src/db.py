@@ -271,9 +271,36 @@ FSS_SIGNAL_TYPE = [
     "StationDodec",
 ]
 
+# Enums validated at import time, by name. Loaded into the enum_values table by create_schema.
+ENUMS = {
+    "POWER": POWER,
+    "POWERPLAYSTATE": POWERPLAYSTATE,
+    "ALLEGIANCE": ALLEGIANCE,
+    "ECONOMY": ECONOMY,
+    "GOVERNMENT": GOVERNMENT,
+    "SECURITY": SECURITY,
+    "BODY_TYPE": BODY_TYPE,
+    "STATION_TYPE": STATION_TYPE,
+    "CARRIER_DOCKING_ACCESS": CARRIER_DOCKING_ACCESS,
+    "SIGNAL_TYPE": SIGNAL_TYPE,
+    "FACTION_STATE": FACTION_STATE,
+    "HAPPINESS": HAPPINESS,
+    "COMMODITY_BRACKET": COMMODITY_BRACKET,
+    "CONFLICT_STATUS": CONFLICT_STATUS,
+    "CONFLICT_WAR_TYPE": CONFLICT_WAR_TYPE,
+    "RESERVE_LEVEL": RESERVE_LEVEL,
+    "BELT_OR_RING_TYPE": BELT_OR_RING_TYPE,
+    "FSS_SIGNAL_TYPE": FSS_SIGNAL_TYPE,
+}
+
 def create_schema(conn):
-    # Note: All enum validation is now done at import time via SQL error() function
-    # in extract.py. No enum types are created here anymore.
+    # Note: All enum validation is done at import time in extract.py, against the
+    # enum_values table below. No enum types are created here anymore.
+
+    # Rebuilt on every run so that it always matches the lists at the top of this file.
+    conn.execute("CREATE OR REPLACE TABLE enum_values (enum_name VARCHAR NOT NULL, value VARCHAR NOT NULL);")
+    for enum_name, values in ENUMS.items():
+        conn.execute("INSERT INTO enum_values SELECT ?, unnest(?::VARCHAR[])", [enum_name, values])
     
     conn.execute(f"""
     CREATE TYPE IF NOT EXISTS faction_detail AS STRUCT(
@@ -315,6 +342,23 @@ def create_schema(conn):
     );
     """)
 
+    # Byte offset of the last imported line in a growing .jsonl file, plus a hash of the
+    # bytes just before it so we can tell whether the file was rewritten in the meantime.
+    conn.execute("ALTER TABLE imported_files ADD COLUMN IF NOT EXISTS last_offset BIGINT DEFAULT 0;")
+    conn.execute("ALTER TABLE imported_files ADD COLUMN IF NOT EXISTS tail_fingerprint VARCHAR;")
+
+    # Rows of imported files that were skipped because of an unknown enum value.
+    # line is the line number in filename, field and value the offending value.
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS rejected_rows (
+        filename VARCHAR NOT NULL,
+        line BIGINT NOT NULL,
+        field VARCHAR NOT NULL,
+        value VARCHAR,
+        rejected_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    """)
+
     conn.execute("""
     --DROP TABLE jumps;
     --DELETE FROM imported_files WHERE filename LIKE 'Journal.FSDJump%';
@@ -493,9 +537,14 @@ def create_schema(conn):
     );
     """)
 
+    # Hash of each extracted message without its timestamp, used by extract.py to drop the
+    # copies of one event that EDDN relays from several uploaders.
+    for table in ["jumps", "location", "docked"]:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS ContentHash UBIGINT;")
+
     conn.execute("""
     CREATE OR REPLACE VIEW jumps_location AS
-        SELECT * FROM jumps
+        SELECT * EXCLUDE (ContentHash) FROM jumps
         UNION ALL
         SELECT 
             timestamp,
@@ -525,19 +574,10 @@ def create_schema(conn):
     """)
 
 
-    conn.execute("""
-    CREATE OR REPLACE VIEW system_latest AS
-    SELECT 
-        SystemAddress, 
-        -- for all the "normal" columns, just take the most recent value.
-        first(COLUMNS(* EXCLUDE (SystemAddress, timestamp, PowerplayStateControlProgress, PowerplayStateReinforcement, PowerplayStateUndermining)) ORDER BY timestamp DESC),
-        -- some Powerplay columns may be inexplicably NULL, so we use any_value() to get the most recent non-NULL value in that case.
-        any_value(COLUMNS(['PowerplayStateControlProgress', 'PowerplayStateReinforcement', 'PowerplayStateUndermining']) ORDER BY timestamp DESC),
-        MAX(timestamp) AS timestamp,
-        first(timestamp ORDER BY timestamp DESC) FILTER (PowerplayStateControlProgress IS NOT NULL) AS PowerplayTimestamp
-    FROM jumps_location
-    GROUP BY SystemAddress;
-    """)
+    # Note: system_latest is now a materialized table created by transform.py.
+    # Drop the view it used to be, so that transform.py can create the table in its place.
+    if conn.execute("SELECT 1 FROM duckdb_views() WHERE view_name = 'system_latest' AND database_name = current_database()").fetchone():
+        conn.execute("DROP VIEW system_latest")
 
     # Note: station_latest is now a materialized table created by transform.py
     # View definition deprecated - see transform.py for materialization logic
@@ -596,6 +636,27 @@ def create_schema(conn):
     """)
 
 
+    create_pipeline_runs_table(conn)
+
+
+def create_pipeline_runs_table(conn):
+    # One row per go.py run, see ledger.py. Times are UTC; stage_seconds only has the stages
+    # that ran, rows_added the net change of the row count of each table.
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS pipeline_runs (
+        run_id VARCHAR PRIMARY KEY,
+        started_at TIMESTAMP NOT NULL,
+        finished_at TIMESTAMP NOT NULL,
+        failed_stages VARCHAR[],
+        stage_seconds MAP(VARCHAR, DOUBLE),
+        data_dump_files INTEGER,
+        rows_added MAP(VARCHAR, BIGINT),
+        db_bytes BIGINT,
+        site_db_bytes BIGINT
+    );
+    """)
+
+
 def connect_db(db_path=DB_MAIN_PATH):
     return duckdb.connect(db_path)
 
@@ -1,9 +1,24 @@
 import os
-import requests
 import datetime as dt
 from constants import DIR_DATA_DUMP, EVENT_TYPES, URL_BASE_EDGALAXYDATA
 import bz2
 import gzip
+import time
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+import http_client
+import tracing
+from dl_today import parse_content_range
+
+# Forking copies the process with go.py's stage threads and the download threads running, which
+# can leave the child waiting on a lock held by one of them; start the transcoders fresh instead.
+TRANSCODE_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+# Level 6 is several times faster than gzip's default of 9 for a few percent larger files.
+GZIP_LEVEL = 6
+TRANSCODE_CHUNK_SIZE = 1024 * 1024
+# Bytes before the end of a partial local day that are fetched again and compared with the local copy.
+RECONCILE_OVERLAP_BYTES = 4096
 
 def get_last_modified_path(bz2_path):
     return bz2_path + ".lastmodified"
@@ -20,44 +35,142 @@ def write_last_modified(bz2_path, last_modified):
     with open(lm_path, "w") as f:
         f.write(last_modified)
 
-def download_and_decompress_daily_file(event_type: str, date: dt.date):
+def daily_file_paths(event_type: str, date: dt.date):
+    """URL of the archived day, and the local .bz2 and plain .jsonl paths for it."""
     month_folder = date.strftime("%Y-%m")
     filename = f"{event_type}-{date.strftime('%Y-%m-%d')}.jsonl"
     url = f"{URL_BASE_EDGALAXYDATA}{month_folder}/{filename}.bz2"
+    return url, os.path.join(DIR_DATA_DUMP, f"{filename}.bz2"), os.path.join(DIR_DATA_DUMP, filename)
+
+
+def reconcile_daily_file(event_type: str, date: dt.date):
+    """Complete the partial plain .jsonl dl_today left of a finished day with just the bytes it misses.
+
+    The day is over once its archive exists, which a HEAD request tells without downloading it.
+    The rest of the day is then fetched from the plain file, starting RECONCILE_OVERLAP_BYTES
+    before the end of the local copy. If the remote bytes there match the local ones, the local
+    copy is a prefix of the day and the tail is appended to it; extract then only imports the tail.
+
+    Returns the HTTP status (206 when the local copy was completed, or that of the archive if it
+    is not there yet) and the number of bytes appended, or None if the full archive is needed.
+    """
+    url, bz2_path, jsonl_path = daily_file_paths(event_type, date)
+    local_size = os.path.getsize(jsonl_path)
+    if local_size == 0:
+        return None
+
+    archive = http_client.head(url, label="dl_hist")
+    if archive.status_code != 200:
+        return archive.status_code, 0
+
+    start = max(local_size - RECONCILE_OVERLAP_BYTES, 0)
+    with open(jsonl_path, "rb") as f:
+        f.seek(start)
+        local_overlap = f.read()
+    resp = http_client.get(URL_BASE_EDGALAXYDATA + os.path.basename(jsonl_path), headers={"Range": f"bytes={start}-"}, label="dl_hist")
+    if resp.status_code != 206 or parse_content_range(resp.headers.get("Content-Range"))[0] != start:
+        http_client.finish(resp)
+        print(f"{jsonl_path}: the plain file of the day is not available (HTTP {resp.status_code}), downloading the archive.")
+        return None
+
+    chunks = resp.iter_content(chunk_size=http_client.CHUNK_SIZE)
+    overlap = b""
+    for chunk in chunks:
+        overlap += chunk
+        if len(overlap) >= len(local_overlap):
+            break
+    if overlap[:len(local_overlap)] != local_overlap:
+        http_client.finish(resp, len(overlap))
+        print(f"{jsonl_path}: local copy is not a prefix of the day, downloading the archive.")
+        return None
+
+    appended = len(overlap) - len(local_overlap)
+    with open(jsonl_path, "ab") as f:
+        f.write(overlap[len(local_overlap):])
+        for chunk in chunks:
+            f.write(chunk)
+            appended += len(chunk)
+    http_client.finish(resp, len(local_overlap) + appended)
+    last_mod = archive.headers.get("Last-Modified")
+    if last_mod:
+        write_last_modified(bz2_path, last_mod)
+    return resp.status_code, appended
+
+
+def download_daily_file(event_type: str, date: dt.date):
+    """Fetch an archived day if it changed since the last download.
+
+    A partial plain copy of the day is completed with reconcile_daily_file instead, if it turns out
+    to be a prefix of the day. Returns the HTTP status, the path to transcode (None unless there is
+    something new) and the number of bytes downloaded.
+    """
+    url, bz2_path, jsonl_path = daily_file_paths(event_type, date)
     os.makedirs(DIR_DATA_DUMP, exist_ok=True)
-    bz2_path = os.path.join(DIR_DATA_DUMP, f"{filename}.bz2")
-    jsonl_path = os.path.join(DIR_DATA_DUMP, filename)
+
+    if os.path.exists(jsonl_path):
+        reconciled = reconcile_daily_file(event_type, date)
+        if reconciled:
+            status, appended = reconciled
+            return status, jsonl_path if status == 206 else None, appended
 
     headers = {}
     last_modified = read_last_modified(bz2_path)
     if last_modified:
         headers["If-Modified-Since"] = last_modified
 
-    print(f"Checking {url} ...", end="")
-    resp = requests.get(url, stream=True, headers=headers)
+    resp = http_client.get(url, headers=headers, label="dl_hist")
     if resp.status_code == 304:
-        print(f"Not modified, skipping.")
+        http_client.finish(resp)
+        return resp.status_code, None, 0
     elif resp.status_code == 200:
-        with open(bz2_path, "wb") as f:
-            for chunk in resp.iter_content(chunk_size=8192):
-                f.write(chunk)
+        downloaded = http_client.stream_to_file(resp, bz2_path)
         # Save Last-Modified header if present
         last_mod = resp.headers.get("Last-Modified")
         if last_mod:
             write_last_modified(bz2_path, last_mod)
-        # Decompress since we downloaded a file
-        with bz2.open(bz2_path, "rb") as f_in, gzip.open(jsonl_path + ".gz", "wb") as f_out:
-            for chunk in iter(lambda: f_in.read(8192), b""):
-                f_out.write(chunk)
-        print(f"Downloaded & recompressed.")
-        # Remove the original .bz2 file
-        os.remove(bz2_path)
-        if os.path.exists(jsonl_path):
-            os.remove(jsonl_path)
-            print(f"Deleted uncompressed file {jsonl_path}")
+        return resp.status_code, bz2_path, downloaded
     else:
-        print(f"Failed to download: HTTP {resp.status_code}")
-        return
+        http_client.finish(resp)
+        return resp.status_code, None, 0
+
+
+def transcode_daily_file(path):
+    """Compress a complete day, a downloaded .bz2 or a reconciled plain .jsonl, to .jsonl.gz.
+
+    Removes the .bz2 and the plain .jsonl of that day afterwards. CPU bound, so main runs it in a
+    process pool. Returns the path, the uncompressed size and the size of the .jsonl.gz.
+    """
+    jsonl_path = path.removesuffix(".bz2")
+    tmp_path = jsonl_path + ".gz.tmp"
+    size = 0
+    opener = bz2.open if path.endswith(".bz2") else open
+    with opener(path, "rb") as f_in, gzip.open(tmp_path, "wb", compresslevel=GZIP_LEVEL) as f_out:
+        for chunk in iter(lambda: f_in.read(TRANSCODE_CHUNK_SIZE), b""):
+            f_out.write(chunk)
+            size += len(chunk)
+    os.replace(tmp_path, jsonl_path + ".gz")
+    for done in {path, jsonl_path}:
+        if os.path.exists(done):
+            os.remove(done)
+    return path, size, os.path.getsize(jsonl_path + ".gz")
+
+
+def download_and_decompress_daily_file(event_type: str, date: dt.date):
+    status, path, _ = download_daily_file(event_type, date)
+    print(f"{event_type} {date}: {describe_download(status)}")
+    if path:
+        transcode_daily_file(path)
+        print(f"Recompressed {path}.")
+
+
+def describe_download(status):
+    if status == 200:
+        return "downloaded"
+    if status == 206:
+        return "completed the local copy"
+    if status == 304:
+        return "not modified, skipping"
+    return f"failed to download: HTTP {status}"
 
 
 def download_edsm_gzip_file(url: str, filename: str):
@@ -85,18 +198,18 @@ def download_edsm_gzip_file(url: str, filename: str):
         headers["If-Modified-Since"] = last_modified
 
     print(f"Checking {url} ...")
-    resp = requests.get(url, stream=True, headers=headers)
+    resp = http_client.get(url, headers=headers, label="dl_hist")
     if resp.status_code == 304:
+        http_client.finish(resp)
         print(f"{gz_path} not modified on server, skipping download.")
     elif resp.status_code == 200:
-        with open(gz_path, "wb") as f:
-            for chunk in resp.iter_content(chunk_size=8192):
-                f.write(chunk)
+        http_client.stream_to_file(resp, gz_path)
         print(f"Downloaded {filename}")
         last_mod = resp.headers.get("Last-Modified")
         if last_mod:
             write_last_modified_gz(gz_path, last_mod)
     else:
+        http_client.finish(resp)
         print(f"Failed to download {filename}: HTTP {resp.status_code}")
 
 
@@ -128,13 +241,45 @@ def compress_jsonl_files_except_today():
 
 
 
-def main(today, lookback_days):
-    for days_ago in range(1, lookback_days + 1):
-        date = today - dt.timedelta(days=days_ago)
-        for event_type in EVENT_TYPES:
-            download_and_decompress_daily_file(event_type, date)
+def main(today, lookback_days, download_workers=4, transcode_workers=None):
+    """Download the archived days of the lookback window and recompress them to .jsonl.gz.
+
+    Runs as a pipeline: a few download threads (bounded, to be nice to the server) feed a process
+    pool that transcodes each file as soon as it is in, so the CPU-bound bz2 decompression runs on
+    all cores and overlaps with the downloads.
+    """
+    jobs = [(event_type, today - dt.timedelta(days=days_ago))
+            for days_ago in range(1, lookback_days + 1)
+            for event_type in EVENT_TYPES]
+    start = time.time()
+    downloaded_bytes = 0
+    transcoded_bytes = 0
+    written_bytes = 0
+    transcoded = 0
+
+    with ThreadPool(download_workers) as downloads, multiprocessing.get_context(TRANSCODE_START_METHOD).Pool(transcode_workers) as transcodes:
+        pending = []
+        results = downloads.imap_unordered(lambda job: (job, *download_daily_file(*job)), jobs)
+        for i, ((event_type, date), status, path, downloaded) in enumerate(results):
+            downloaded_bytes += downloaded
+            if path:
+                pending.append(transcodes.apply_async(transcode_daily_file, (path,)))
+            print(f"[{i + 1}/{len(jobs)}] {event_type} {date}: {describe_download(status)} "
+                  f"({downloaded_bytes / 1e6:.1f} MB, {downloaded_bytes / 1e6 / max(time.time() - start, 1e-3):.1f} MB/s)")
+        for result in pending:
+            path, size, written = result.get()
+            transcoded += 1
+            transcoded_bytes += size
+            written_bytes += written
+            print(f"Recompressed {transcoded}/{len(pending)}: {os.path.basename(path)} ({size / 1e6:.1f} MB)")
+
+    elapsed = time.time() - start
+    print(f"Historical files done in {elapsed:.1f}s: {len(pending)} of {len(jobs)} files new, "
+          f"{downloaded_bytes / 1e6:.1f} MB downloaded, {transcoded_bytes / 1e6:.1f} MB recompressed "
+          f"({transcoded_bytes / 1e6 / max(elapsed, 1e-3):.1f} MB/s)")
     download_systems_populated()
     # download_stations()
+    tracing.record(bytes_read=http_client.print_summary("dl_hist"), bytes_written=written_bytes)
 
 
 def download_historical_files(fro, to, event):
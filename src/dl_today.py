@@ -7,10 +7,12 @@ from urllib.parse import urljoin
 
 from constants import DIR_DATA_DUMP, EVENT_TYPES, URL_BASE_EDGALAXYDATA
 from multiprocessing.pool import ThreadPool
+import http_client
+import tracing
 
 
 def get_today_from_website():
-    response = requests.get(URL_BASE_EDGALAXYDATA, timeout=30)
+    response = http_client.get_session().get(URL_BASE_EDGALAXYDATA, timeout=30)
     response.raise_for_status()
     
     html_content = response.text
@@ -39,102 +41,71 @@ def get_last_downloaded_position(local_data_path):
     return os.path.getsize(local_data_path)
 
 
-def download_incremental(remote_url, local_data_path, verbose=False):
-    last_position = get_last_downloaded_position(local_data_path)
-    if verbose:
-        print(f"Attempting to download from byte: {last_position}")
-
-    head_response = requests.head(remote_url, stream=True)
-    head_response.raise_for_status() 
+def parse_content_range(content_range):
+    """(start, total) of a Content-Range header like 'bytes 100-199/1000' or 'bytes */1000'. Either may be None."""
+    try:
+        range_part, total = content_range.split(' ')[1].split('/')
+        start = None if range_part == '*' else int(range_part.split('-')[0])
+        return start, None if total == '*' else int(total)
+    except (AttributeError, IndexError, ValueError):
+        print(f"Warning: Could not parse Content-Range header '{content_range}'.")
+        return None, None
 
-    content_length_header = head_response.headers.get('Content-Length')
-    if not content_length_header:
-        print("Warning: Could not get 'Content-Length' from HEAD response. Cannot determine remote file size.")
-        # If we can't get the size, we can't reliably use ranges or know if there's new data.
-        # For this script, we'll exit if we can't get size, as range logic depends on it.
-        return
 
-    remote_file_size = int(content_length_header)
-    if remote_file_size == 0:
-        print("Remote file is empty.")
-        return
+def download_incremental(remote_url, local_data_path, verbose=False):
+    """Append the bytes the remote file gained since the last run to the local copy.
 
+    A single GET with a Range from the current local size; the status tells whether there is
+    new data (206), none (416 with the same total size), or the remote file was replaced (416
+    with a smaller size). If-Range is not used: the file changes with every append, so its
+    validators would never match and every request would turn into a full download.
+    """
+    last_position = get_last_downloaded_position(local_data_path)
     if verbose:
-        print(f"Remote file size: {remote_file_size} bytes")
-
-    # 2. Determine if there's new data
-    if last_position >= remote_file_size:
-        print("No new data available.")
-        return
+        print(f"Attempting to download from byte: {last_position}")
 
-    range_header = f"bytes={last_position}-"
-    headers = {"Range": range_header}
-    if verbose:
-        print(f"Requesting range: {range_header}")
-    
-    response = requests.get(remote_url, headers=headers, stream=True, timeout=120)
+    headers = {"Range": f"bytes={last_position}-"} if last_position > 0 else {}
+    response = http_client.get(remote_url, headers=headers, timeout=120, label="dl_today")
+    os.makedirs(os.path.dirname(local_data_path) or '.', exist_ok=True)
 
-    # Check the response status code
     if response.status_code == 206: # 206 Partial Content - Success!
-        # Verify the Content-Range header matches what we asked for (optional but good)
-        content_range = response.headers.get('Content-Range')
-        if content_range:
-            # Expected format: bytes <start>-<end>/<total>
-            try:
-                range_info_part = content_range.split(' ')[1]
-                if '/' in range_info_part:
-                    range_part = range_info_part.split('/')[0]
-                    if '-' in range_part:
-                        range_info = range_part.split('-')
-                        # Check if the received start byte matches the requested start byte
-                        received_start_byte = int(range_info[0])
-                        if received_start_byte != last_position:
-                            print(f"Warning: Requested range start {last_position}, but received Content-Range starts at {received_start_byte}. Server might not fully support Range requests as expected.")
-                    else:
-                        print(f"Warning: Could not parse range part of Content-Range header '{content_range}'.")
-                else:
-                    print(f"Warning: Could not parse total size part of Content-Range header '{content_range}'.")
-            except (IndexError, ValueError) as e:
-                print(f"Warning: Could not parse Content-Range header '{content_range}': {e}")
-
-
-        downloaded_bytes = 0
-        os.makedirs(os.path.dirname(local_data_path) or '.', exist_ok=True)
-        with open(local_data_path, 'ab') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk: # filter out keep-alive new chunks
-                    f.write(chunk)
-                    downloaded_bytes += len(chunk)
-
-        new_position = last_position + downloaded_bytes
+        received_start_byte, remote_file_size = parse_content_range(response.headers.get('Content-Range'))
+        if received_start_byte is not None and received_start_byte != last_position:
+            print(f"Warning: Requested range start {last_position}, but received Content-Range starts at {received_start_byte}. No data appended.")
+            http_client.finish(response)
+            return
+        downloaded_bytes = http_client.stream_to_file(response, local_data_path, "ab")
         if verbose:
-            print(f"Successfully downloaded {downloaded_bytes} bytes.")
+            print(f"Successfully downloaded {downloaded_bytes} bytes, remote file size: {remote_file_size} bytes.")
 
-    elif response.status_code == 200: # 200 OK - Server might not support Range or ignored it
+    elif response.status_code == 200: # 200 OK - initial download, or the server ignored Range
         if last_position == 0:
-            print("Received 200 OK. Server might not support Range or this is the initial download.")
-            downloaded_bytes = 0
-            os.makedirs(os.path.dirname(local_data_path) or '.', exist_ok=True)
-            with open(local_data_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
-                        downloaded_bytes += len(chunk)
-
-            new_position = downloaded_bytes
+            if response.headers.get('Content-Length') == '0':
+                print("Remote file is empty.")
+                http_client.finish(response)
+                return
+            downloaded_bytes = http_client.stream_to_file(response, local_data_path, "wb")
             print(f"Successfully downloaded initial file ({downloaded_bytes} bytes).")
         else:
+            http_client.finish(response)
             print(f"Warning: Requested range from byte {last_position}, but received 200 OK. Server likely ignored Range header. No data appended to avoid duplicates.")
             print("Consider checking server configuration for Range support.")
 
     elif response.status_code == 416: # 416 Range Not Satisfiable
-        print(f"Received 416 Range Not Satisfiable. This likely means the requested byte position ({last_position}) is beyond the current file size ({remote_file_size}).")
+        http_client.finish(response)
+        _, remote_file_size = parse_content_range(response.headers.get('Content-Range'))
+        if remote_file_size is None or remote_file_size == last_position:
+            # without a size, the common case: we already have everything
+            print("No new data available.")
+            return
+        print(f"Received 416 Range Not Satisfiable. The requested byte position ({last_position}) is beyond the current file size ({remote_file_size}).")
         os.remove(local_data_path)
         print(f"Removed file {local_data_path} due to 416 error. Will re-download on next run.")
 
         # We reset the state. The next scheduled run will attempt a full download.
 
     else: # Other HTTP errors
+        http_client.finish(response)
         print(f"Received unexpected HTTP status code: {response.status_code}")
         response.raise_for_status() # Raise an HTTPError for other 4xx or 5xx responses
 
@@ -160,11 +131,13 @@ def dl_event(event_type_today):
     return event_type
     
 
-def main():
-    today = get_today_from_website()
+def main(today=None):
+    today = today or get_today_from_website()
     results = ThreadPool(8).imap_unordered(dl_event, [(event_type, today) for event_type in EVENT_TYPES])
     for i, event_type in enumerate(results):
         print(f"Done: {event_type} ({i+1}/{len(EVENT_TYPES)})")
+    downloaded = http_client.print_summary("dl_today")
+    tracing.record(bytes_read=downloaded, bytes_written=downloaded)
     return today
         
 
@@ -1,25 +1,34 @@
+import argparse
+import datetime as dt
 import os
 import re
-from db import (
-    connect_db, create_schema, POWER, POWERPLAYSTATE, ALLEGIANCE, ECONOMY, 
-    GOVERNMENT, SECURITY, BODY_TYPE, STATION_TYPE, CARRIER_DOCKING_ACCESS, 
-    SIGNAL_TYPE, FACTION_STATE, HAPPINESS, COMMODITY_BRACKET,
-    RESERVE_LEVEL, BELT_OR_RING_TYPE, FSS_SIGNAL_TYPE, CONFLICT_STATUS,
-    CONFLICT_WAR_TYPE
-)
+from db import connect_db, create_schema
 from constants import DIR_DATA_DUMP
+from contextlib import contextmanager, ExitStack
 import gzip
+import hashlib
+import tempfile
+from multiprocessing.pool import ThreadPool
+import sql_profile
+import tracing
 
 def get_imported_files(conn):
-    result = conn.execute("SELECT filename, last_line, filesize FROM imported_files").fetchall()
-    return {row[0]: {"last_line": row[1], "filesize": row[2]} for row in result}
+    result = conn.execute("SELECT filename, last_line, filesize, last_offset, tail_fingerprint FROM imported_files").fetchall()
+    return {
+        row[0]: {"last_line": row[1], "filesize": row[2], "last_offset": row[3], "tail_fingerprint": row[4]}
+        for row in result
+    }
 
-def update_imported_file(conn, filename: str, last_line, filesize):
+def update_imported_file(conn, filename: str, last_line, filesize, last_offset=0, tail_fingerprint=None):
     conn.execute("""
-        INSERT INTO imported_files (filename, last_line, filesize)
-        VALUES (?, ?, ?)
-        ON CONFLICT(filename) DO UPDATE SET last_line=excluded.last_line, filesize=excluded.filesize
-    """, [filename.removesuffix(".gz"), last_line, filesize])
+        INSERT INTO imported_files (filename, last_line, filesize, last_offset, tail_fingerprint)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(filename) DO UPDATE SET
+            last_line=excluded.last_line,
+            filesize=excluded.filesize,
+            last_offset=excluded.last_offset,
+            tail_fingerprint=excluded.tail_fingerprint
+    """, [filename.removesuffix(".gz"), last_line, filesize, last_offset, tail_fingerprint])
 
 IMPORT_CUTOFF = "2025-09-01"
 
@@ -35,16 +44,292 @@ def should_import_file(fname, imported, required_substring=None):
     fpath = os.path.join(DIR_DATA_DUMP, fname)
     filesize = os.path.getsize(fpath)
     imported_entry = imported.get(fname.removesuffix(".gz"), {})
-    last_line = imported_entry.get("last_line", 0)
     old_filesize = imported_entry.get("filesize", None)
     if old_filesize == filesize:
         print(f"Skipping {fname}: file size unchanged.")
         return False, None, None, None
-    return True, fpath, filesize, last_line
+    return True, fpath, filesize, imported_entry
+
+# Number of bytes before the recorded offset that are hashed to detect rewritten files.
+FINGERPRINT_BYTES = 4096
+
+def get_tail_fingerprint(f, offset):
+    start = max(0, offset - FINGERPRINT_BYTES)
+    f.seek(start)
+    return hashlib.sha1(f.read(offset - start)).hexdigest()
+
+@contextmanager
+def import_source(fpath, imported_entry):
+    """
+    Work out which part of fpath still has to be imported.
+
+    Plain .jsonl files are the ones dl_today keeps appending to. If the bytes just before
+    the recorded offset still match the stored fingerprint, only the complete lines after
+    that offset are copied to a temp file, so an hourly run reads just the new data.
+    Otherwise (first import, file re-downloaded, or an entry from before offsets were
+    tracked) the whole file is read and rows up to last_line are skipped as before.
+    Compressed files are complete daily archives and are read in full, unless they are the
+    plain file of the day recompressed by dl_hist after its reconciliation: then only the
+    lines after the recorded offset are copied out, like for the plain file.
+
+    Yields a dict with:
+        path: file to read, or None if there are no new complete lines yet
+        skip: number of leading rows to skip (compared against rn)
+        first_line: line number in fpath the import starts from, for logging
+        lines_before: lines of fpath that come before path (added to its line count)
+        offset, fingerprint: new byte offset and fingerprint to record
+    """
+    last_line = imported_entry.get("last_line", 0)
+    last_offset = imported_entry.get("last_offset") or 0
+    fingerprint = imported_entry.get("tail_fingerprint")
+    compressed = not fpath.endswith(".jsonl")
+    whole_file = {"path": fpath, "skip": last_line, "first_line": last_line + 1, "lines_before": 0, "offset": 0, "fingerprint": None}
+    if compressed and not fingerprint:
+        yield whole_file
+        return
 
-def create_temp_table(fpath):
+    fd, tail_path = tempfile.mkstemp(suffix=".jsonl")
+    try:
+        with (gzip.open if compressed else open)(fpath, "rb") as f, os.fdopen(fd, "wb") as tail:
+            if fingerprint and (compressed or last_offset <= os.path.getsize(fpath)) and get_tail_fingerprint(f, last_offset) == fingerprint:
+                start, skip, lines_before = last_offset, 0, last_line
+            elif compressed:
+                start = None
+            else:
+                start, skip, lines_before = 0, last_line, 0
+
+            if start is not None:
+                f.seek(start)
+                copied, end = 0, 0
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    tail.write(chunk)
+                    newline = chunk.rfind(b"\n")
+                    if newline >= 0:
+                        end = copied + newline + 1
+                    copied += len(chunk)
+                # only take complete lines, a partially downloaded one is picked up next run
+                tail.truncate(end)
+                # archives do not grow, so they are not fingerprinted
+                new_fingerprint = None if compressed else get_tail_fingerprint(f, start + end)
+
+        if start is None:
+            yield whole_file
+        elif end == 0:
+            if compressed:
+                yield {"path": None, "skip": 0, "first_line": last_line + 1, "lines_before": last_line, "offset": 0, "fingerprint": None}
+            else:
+                yield {"path": None, "skip": 0, "first_line": last_line + 1, "lines_before": last_line, "offset": last_offset, "fingerprint": fingerprint}
+        else:
+            yield {
+                "path": tail_path,
+                "skip": skip,
+                "first_line": lines_before + skip + 1,
+                "lines_before": lines_before,
+                "offset": 0 if compressed else start + end,
+                "fingerprint": new_fingerprint,
+            }
+    finally:
+        os.remove(tail_path)
+
+def sql_string(value):
+    return "'" + value.replace("'", "''") + "'"
+
+HEADER_TYPE = "STRUCT(gameversion VARCHAR, gatewayTimestamp VARCHAR)"
+
+def message_schema(text_fields, json_fields=()):
     """
-    Creates a temp table from EDDN JSONL data with game version filtering.
+    Declares the message fields an importer reads, as the STRUCT type handed to read_ndjson.
+
+    text_fields are read as VARCHAR (what message->>'x' used to return), json_fields as JSON
+    (what message->'x' used to return). Any other field in the file is skipped by the JSON
+    reader instead of being inferred, parsed and kept around.
+    """
+    fields = [f'"{name}" VARCHAR' for name in text_fields] + [f'"{name}" JSON' for name in json_fields]
+    return f"STRUCT({', '.join(fields)})"
+
+def create_temp_table(conn, sources, message_type, label):
+    """
+    Parses all sources in a single scan into the temp table tmp_raw.
+
+    Args:
+        sources: list of (path, skip) pairs; rows with rn <= skip are dropped by select_valid_rows()
+        message_type: STRUCT type of the message column, see message_schema()
+        label: label of the importer, names the scan for sql_profile
+
+    Returns:
+        dict of path -> number of lines read from it
+
+    Every line gets a row (malformed ones come back as all-NULL rows with ignore_errors),
+    and rn is numbered per file before any filtering, so rn is the line number in its file.
+    The counts that end up in imported_files therefore come from the same scan that feeds
+    the insert, and a compressed file never has to be decompressed a second time.
+    """
+    paths = ", ".join(sql_string(path) for path, _ in sources)
+    skips = ", ".join(f"({sql_string(path)}, {int(skip)})" for path, skip in sources)
+    sql_profile.execute(conn, f"import_{label}_scan", f"""
+        CREATE OR REPLACE TEMP TABLE tmp_raw AS
+        WITH scan AS (
+            SELECT *, row_number() OVER () AS scan_rn
+            FROM read_ndjson(
+                [{paths}],
+                columns={{'header': {sql_string(HEADER_TYPE)}, 'message': {sql_string(message_type)}}},
+                ignore_errors=true,
+                filename=true
+            )
+        )
+        SELECT
+            scan.* EXCLUDE (scan_rn),
+            scan_rn - min(scan_rn) OVER (PARTITION BY filename) + 1 AS rn,
+            skips.skip
+        FROM scan
+        JOIN (VALUES {skips}) skips(filename, skip) USING (filename)
+    """)
+    return dict(conn.execute("SELECT filename, count(*) FROM tmp_raw GROUP BY filename").fetchall())
+
+# Rows with the same content (everything but the timestamp) less than this many seconds after the
+# last kept one are copies of one event relayed by several uploaders; only the first one is kept.
+DEDUP_WINDOW_SECONDS = 600
+
+def drop_duplicate_rows(conn, table, batch, window_seconds=DEDUP_WINDOW_SECONDS):
+    """
+    Removes the rows of tmp_extracted that duplicate a kept row, so they never reach table.
+
+    A row is a duplicate if a row with the same ContentHash is already stored in table at
+    most window_seconds apart from it, or if the last row with that ContentHash kept from
+    this batch (by timestamp, then file and line) is at most window_seconds before it.
+    Measuring from the last kept row rather than the row just before keeps a chain of real
+    sightings of an unchanged system: one every window_seconds or so is kept.
+
+    Returns:
+        number of dropped rows per file name
+    """
+    window = f"INTERVAL {int(window_seconds)} SECOND"
+    # only rows with a stored or batch row of the same content within the window can be dropped
+    candidates = conn.execute(f"""
+        WITH batch AS (
+            SELECT
+                filename, rn, ContentHash, CAST(timestamp AS TIMESTAMP) AS ts,
+                LAG(CAST(timestamp AS TIMESTAMP)) OVER w AS prev_ts,
+                LEAD(CAST(timestamp AS TIMESTAMP)) OVER w AS next_ts
+            FROM tmp_extracted
+            WINDOW w AS (PARTITION BY ContentHash ORDER BY CAST(timestamp AS TIMESTAMP), filename, rn)
+        ),
+        stored AS (
+            SELECT ContentHash, CAST(timestamp AS TIMESTAMP) AS ts
+            FROM {table}
+            WHERE timestamp BETWEEN (SELECT min(ts) - {window} FROM batch) AND (SELECT max(ts) + {window} FROM batch)
+                AND ContentHash IN (SELECT ContentHash FROM batch)
+        ),
+        near_stored AS (
+            SELECT DISTINCT batch.filename, batch.rn
+            FROM batch
+            JOIN stored ON stored.ContentHash = batch.ContentHash
+                AND stored.ts BETWEEN batch.ts - {window} AND batch.ts + {window}
+        )
+        SELECT batch.filename, batch.rn, batch.ContentHash, batch.ts, near_stored.rn IS NOT NULL
+        FROM batch
+        LEFT JOIN near_stored USING (filename, rn)
+        WHERE batch.ts - batch.prev_ts <= {window}
+            OR batch.next_ts - batch.ts <= {window}
+            OR near_stored.rn IS NOT NULL
+        ORDER BY batch.ContentHash, batch.ts, batch.filename, batch.rn
+    """)
+
+    # which row is kept depends on which rows before it were, so this walks the rows in order
+    window_delta = dt.timedelta(seconds=int(window_seconds))
+    filenames, rns = [], []
+    last_hash, last_kept = None, None
+    while rows := candidates.fetchmany(100_000):
+        for filename, rn, content_hash, ts, is_near_stored in rows:
+            if content_hash != last_hash:
+                last_hash, last_kept = content_hash, None
+            if is_near_stored or (last_kept is not None and ts - last_kept <= window_delta):
+                filenames.append(filename)
+                rns.append(rn)
+            else:
+                last_kept = ts
+
+    conn.execute("""
+        CREATE OR REPLACE TEMP TABLE tmp_duplicates AS
+        SELECT unnest(?::VARCHAR[]) AS filename, unnest(?::BIGINT[]) AS rn
+    """, [filenames, rns])
+    conn.execute("DELETE FROM tmp_extracted WHERE (filename, rn) IN (SELECT filename, rn FROM tmp_duplicates)")
+    dropped = conn.execute("SELECT filename, count(*) FROM tmp_duplicates GROUP BY filename").fetchall()
+    conn.execute("DROP TABLE IF EXISTS tmp_duplicates")
+    names = {source["path"]: fname for fname, _, source in batch}
+    return {names[path]: count for path, count in dropped}
+
+def import_jsonl_files(conn, imported, required_substring, label, message_type, extract_sql, enum_fields, insert_sql, batch_size=None, dedup_table=None, dedup_window=DEDUP_WINDOW_SECONDS):
+    """
+    Imports all pending files whose name contains required_substring.
+
+    Only the message fields declared in message_type are read (see message_schema()).
+    extract_sql turns the new rows (read through select_valid_rows()) into tmp_extracted,
+    rows with an unknown value in one of enum_fields are moved to rejected_rows (see
+    reject_invalid_rows()), and insert_sql copies the rest into the target tables.
+    Pending files are scanned together, batch_size at a time (all of them if None), so a
+    backfill of many days is one scan and one query plan per batch instead of one per file.
+
+    If dedup_table is given, tmp_extracted gets a ContentHash column (for insert_sql to
+    store) and copies of rows within dedup_window seconds are dropped first, see
+    drop_duplicate_rows().
+    """
+    with ExitStack() as stack:
+        pending = []
+        for fname in sorted(os.listdir(DIR_DATA_DUMP)):
+            should_import, fpath, filesize, imported_entry = should_import_file(fname, imported, required_substring)
+            if not should_import:
+                continue
+            source = stack.enter_context(import_source(fpath, imported_entry))
+            if source["path"] is None:
+                print(f"Skipping {fname}: no new complete lines.")
+                # record the size, so an unchanged file is not read again
+                update_imported_file(conn, fname, source["lines_before"], filesize, source["offset"], source["fingerprint"])
+                continue
+            pending.append((fname, filesize, source))
+
+        batch_size = batch_size or len(pending) or 1
+        for i in range(0, len(pending), batch_size):
+            batch = pending[i:i + batch_size]
+            # one span per scan, which is one per file with batch_size=1; the rows and bytes read of
+            # each file of the batch are listed under "files"
+            with tracing.span("extract", event=label) as span:
+                for fname, _, source in batch:
+                    print(f"Importing {label} file {fname} from line {source['first_line']}...")
+
+                num_lines = create_temp_table(conn, [(source["path"], source["skip"]) for _, _, source in batch], message_type, label)
+                span["files"] = {
+                    fname: {"rows": num_lines.get(source["path"], 0), "bytes_read": os.path.getsize(source["path"])}
+                    for fname, _, source in batch
+                }
+                span["rows"] = sum(f["rows"] for f in span["files"].values())
+                span["bytes_read"] = sum(f["bytes_read"] for f in span["files"].values())
+                if dedup_table:
+                    sql_profile.execute(conn, f"import_{label}_extract", f"""
+                        CREATE OR REPLACE TEMP TABLE tmp_extracted AS
+                        SELECT *, hash(*COLUMNS(* EXCLUDE (timestamp, filename, rn))) AS ContentHash
+                        FROM ({extract_sql})
+                    """)
+                else:
+                    sql_profile.execute(conn, f"import_{label}_extract", f"CREATE OR REPLACE TEMP TABLE tmp_extracted AS {extract_sql}")
+                for fname, count in reject_invalid_rows(conn, enum_fields, batch).items():
+                    print(f"Rejected {count} rows of {fname} with unknown enum values, see rejected_rows.")
+                if dedup_table:
+                    for fname, count in drop_duplicate_rows(conn, dedup_table, batch, dedup_window).items():
+                        print(f"Dropped {count} duplicate rows of {fname}.")
+                sql_profile.execute(conn, f"import_{label}_insert", insert_sql)
+                conn.execute("DROP TABLE IF EXISTS tmp_raw")
+                conn.execute("DROP TABLE IF EXISTS tmp_extracted")
+
+                for fname, filesize, source in batch:
+                    update_imported_file(
+                        conn, fname, source["lines_before"] + num_lines.get(source["path"], 0),
+                        filesize, source["offset"], source["fingerprint"]
+                    )
+
+def select_valid_rows():
+    """
+    Selects the new rows of tmp_raw that pass game version filtering.
     
     Elite Dangerous galaxy split on May 19, 2021 with Odyssey release:
     - Version 3.x: Legacy/Horizons client (different galaxy state)
@@ -54,23 +339,23 @@ def create_temp_table(fpath):
     - Accept: CAPI sources (server-side, version-agnostic) OR Odyssey 4.x+ client data
     - Reject: All Legacy/Horizons 3.x versions to maintain galaxy consistency
     """
-    return  f"""
-            SELECT *, row_number() OVER () AS rn
-            FROM read_ndjson_auto('{fpath}', union_by_name=true, ignore_errors=true)
-            WHERE 
-                (
+    return  """
+            SELECT *
+            FROM tmp_raw
+            WHERE rn > skip
+                AND (
                     -- CAPI (Companion API) sources: server-side data, version-agnostic, always accept
-                    header->>'gameversion' IN (
+                    header.gameversion IN (
                         'CAPI-journal', 'CAPI-Live-market', 'CAPI-market', 
                     ) 
                     -- Odyssey-era clients: major version >= 4 ensures post-split galaxy consistency
                     -- Legacy versions (named patches like "Fleet Carriers Update") fail the integer cast
-                    OR (TRY_CAST(SPLIT_PART(header->>'gameversion', '.', 1) AS INTEGER) IS NOT NULL
-                        AND TRY_CAST(SPLIT_PART(header->>'gameversion', '.', 1) AS INTEGER) >= 4)
+                    OR (TRY_CAST(SPLIT_PART(header.gameversion, '.', 1) AS INTEGER) IS NOT NULL
+                        AND TRY_CAST(SPLIT_PART(header.gameversion, '.', 1) AS INTEGER) >= 4)
                 )
-                AND TRY_CAST(header->>'gatewayTimestamp' AS TIMESTAMP) IS NOT NULL
-                AND TRY_CAST(message->>'timestamp' AS TIMESTAMP) IS NOT NULL
-                AND TRY_CAST(message->>'timestamp' AS TIMESTAMP) >= TRY_CAST(header->>'gatewayTimestamp' AS TIMESTAMP) - INTERVAL '1 hour'
+                AND TRY_CAST(header.gatewayTimestamp AS TIMESTAMP) IS NOT NULL
+                AND TRY_CAST(message.timestamp AS TIMESTAMP) IS NOT NULL
+                AND TRY_CAST(message.timestamp AS TIMESTAMP) >= TRY_CAST(header.gatewayTimestamp AS TIMESTAMP) - INTERVAL '1 hour'
             """
 
 def to_economy_enum(expr):
@@ -84,7 +369,7 @@ def to_economy_enum(expr):
 
 def to_economy_enum_proportion(expr):
     get_name = "e->>'name'"
-    return f"list_transform(CAST({expr} AS JSON[]), e -> struct_pack(Name := {generate_enum_check(to_economy_enum(get_name), ECONOMY, "Economies.Name")}, Proportion:= e->>'proportion'))"
+    return f"list_transform(CAST({expr} AS JSON[]), e -> struct_pack(Name := {to_enum_value(to_economy_enum(get_name))}, Proportion:= e->>'proportion'))"
 
 def to_government_enum(expr):
     return f"REGEXP_REPLACE(REGEXP_REPLACE({expr}, '^\\$government_', ''), ';$', '')"
@@ -114,7 +399,7 @@ def to_count_signal_type_enum(expr):
     return f"""
         list_transform(CAST({expr} AS JSON[]), s -> struct_pack(
             Count := CAST(s->>'Count' AS INTEGER),
-            Type := {generate_enum_check("CASE WHEN s ->>'Type' = 'tritium' THEN 'Tritium' ELSE REGEXP_REPLACE(REGEXP_REPLACE(s->>'Type', '^\\$SAA_SignalType_', ''), ';$', '') END", SIGNAL_TYPE, "Signals.Type")}
+            Type := {to_enum_value("CASE WHEN s ->>'Type' = 'tritium' THEN 'Tritium' ELSE REGEXP_REPLACE(REGEXP_REPLACE(s->>'Type', '^\\$SAA_SignalType_', ''), ';$', '') END")}
         ))
     """
 
@@ -132,8 +417,8 @@ def to_conflict(expr):
                 Stake := c->'Faction2'->>'Stake',
                 WonDays := CAST(c->'Faction2'->>'WonDays' AS INTEGER)
             ),
-            Status := {generate_enum_check("c->>'Status'", CONFLICT_STATUS, "Conflict.Status")},
-            WarType := {generate_enum_check("c->>'WarType'", CONFLICT_WAR_TYPE, "Conflict.WarType")}
+            Status := {to_enum_value("c->>'Status'")},
+            WarType := {to_enum_value("c->>'WarType'")}
         ))
     """
 
@@ -147,9 +432,9 @@ def to_commodities(expr):
                 SellPrice := c->>'sellPrice',
                 MeanPrice := c->>'meanPrice',
                 Stock := c->>'stock',
-                StockBracket := {generate_enum_check("CASE WHEN c->>'stockBracket' in ('0', '') THEN 'None' WHEN c->>'stockBracket' = '1' THEN 'Low' WHEN c->>'stockBracket' = '2' THEN 'Med' WHEN c->>'stockBracket' = '3' THEN 'High' END", COMMODITY_BRACKET, "Commodities.StockBracket")},
+                StockBracket := {to_enum_value("CASE WHEN c->>'stockBracket' in ('0', '') THEN 'None' WHEN c->>'stockBracket' = '1' THEN 'Low' WHEN c->>'stockBracket' = '2' THEN 'Med' WHEN c->>'stockBracket' = '3' THEN 'High' END")},
                 Demand := c->>'demand',
-                DemandBracket := {generate_enum_check("CASE WHEN c->>'demandBracket' in ('0', '') THEN 'None' WHEN c->>'demandBracket' = '1' THEN 'Low' WHEN c->>'demandBracket' = '2' THEN 'Med' WHEN c->>'demandBracket' = '3' THEN 'High' END", COMMODITY_BRACKET, "Commodities.DemandBracket")},
+                DemandBracket := {to_enum_value("CASE WHEN c->>'demandBracket' in ('0', '') THEN 'None' WHEN c->>'demandBracket' = '1' THEN 'Low' WHEN c->>'demandBracket' = '2' THEN 'Med' WHEN c->>'demandBracket' = '3' THEN 'High' END")},
                 StatusFlags := [replace(replace(flag, 'rare', 'Rare'), 'High demand', 'High Demand') for flag in CAST(c->'statusFlags' AS VARCHAR[])]
             )
         )
@@ -160,472 +445,511 @@ def to_faction_detail(expr):
     return f"""
         list_transform(CAST({expr} AS JSON[]), f -> struct_pack(
             Name := f->>'Name',
-            Allegiance := {generate_enum_check(to_allegiance_enum("f->>'Allegiance'"), ALLEGIANCE, "Factions.Allegiance")},
-            FactionState := {generate_enum_check("f->>'FactionState'", FACTION_STATE, "Factions.FactionState")},
-            Government := {generate_enum_check(to_government_enum("f->>'Government'"), GOVERNMENT, "Factions.Government")},
+            Allegiance := {to_enum_value(to_allegiance_enum("f->>'Allegiance'"))},
+            FactionState := {to_enum_value("f->>'FactionState'")},
+            Government := {to_enum_value(to_government_enum("f->>'Government'"))},
             Influence := f->>'Influence',
-            Happiness := {generate_enum_check("CASE WHEN f->>'Happiness' = '$Faction_HappinessBand1;' THEN 'Elated' WHEN f->>'Happiness' = '$Faction_HappinessBand2;' THEN 'Happy' WHEN f->>'Happiness' = '$Faction_HappinessBand3;' THEN 'Discontented' WHEN f->>'Happiness' = '$Faction_HappinessBand4;' THEN 'Unhappy' WHEN f->>'Happiness' = '$Faction_HappinessBand5;' THEN 'Despondent' ELSE 'Unknown' END", HAPPINESS, "Factions.Happiness")},
+            Happiness := {to_enum_value("CASE WHEN f->>'Happiness' = '$Faction_HappinessBand1;' THEN 'Elated' WHEN f->>'Happiness' = '$Faction_HappinessBand2;' THEN 'Happy' WHEN f->>'Happiness' = '$Faction_HappinessBand3;' THEN 'Discontented' WHEN f->>'Happiness' = '$Faction_HappinessBand4;' THEN 'Unhappy' WHEN f->>'Happiness' = '$Faction_HappinessBand5;' THEN 'Despondent' ELSE 'Unknown' END")},
             ActiveStates := list_transform(CAST(f->'ActiveStates' AS JSON[]), s -> (s->>'State')),
             RecoveringStates := f->'RecoveringStates',
             PendingStates := f->'PendingStates'
         ))
     """
 
-def get_num_lines(fpath):
-    if fpath.endswith(".gz"):
-        with gzip.open(fpath, "rt", encoding="utf-8") as f:
-            return sum(1 for _ in f)
-    else:
-        with open(fpath, "r", encoding="utf-8") as f:
-            return sum(1 for _ in f)
-
+def to_enum_value(expr):
+    """
+    Normalizes an enum value: empty strings become NULL, anything else is kept as is.
 
-def generate_enum_check(column_expr, allowed_values, column_name):
+    The value is checked against its enum afterwards by reject_invalid_rows(), so the
+    (often expensive) expression is evaluated once instead of once per CASE branch.
     """
-    Generate a SQL expression that validates a value against allowed enum values.
-    Returns the expression unchanged if valid, or calls error() with a message if invalid.
-    
-    Args:
-        column_expr: SQL expression to validate (e.g., "message->>'Economy'")
-        allowed_values: List of allowed string values (e.g., ECONOMY constant)
-        column_name: Human-readable column name for error messages
-    
-    Returns:
-        SQL CASE/WHEN expression that validates and returns the value, or errors
-    
-    Example:
-        generate_enum_check("message->>'SystemEconomy'", ECONOMY, "SystemEconomy")
-        -> "CASE WHEN message->>'SystemEconomy' IN (...) THEN message->>'SystemEconomy' ELSE error('Invalid SystemEconomy: ' || message->>'SystemEconomy') END"
+    return f"NULLIF({expr}, '')"
+
+# Enum columns produced by the helpers above, as (path, enum) pairs for reject_invalid_rows().
+def economy_proportion_enums(column):
+    return [(f"{column}[].Name", "ECONOMY")]
+
+COUNT_SIGNAL_TYPE_ENUMS = [("Signals[].Type", "SIGNAL_TYPE")]
+CONFLICT_ENUMS = [
+    ("Conflicts[].Status", "CONFLICT_STATUS"),
+    ("Conflicts[].WarType", "CONFLICT_WAR_TYPE"),
+]
+COMMODITY_ENUMS = [
+    ("Commodities[].StockBracket", "COMMODITY_BRACKET"),
+    ("Commodities[].DemandBracket", "COMMODITY_BRACKET"),
+]
+FACTION_DETAIL_ENUMS = [
+    ("Factions[].Allegiance", "ALLEGIANCE"),
+    ("Factions[].FactionState", "FACTION_STATE"),
+    ("Factions[].Government", "GOVERNMENT"),
+    ("Factions[].Happiness", "HAPPINESS"),
+]
+
+def enum_path_values(path):
     """
-    allowed_str = ', '.join(repr(v) for v in allowed_values)
-    return f"""
-        CASE 
-            WHEN {column_expr} IS NULL THEN NULL
-            WHEN {column_expr} = '' THEN NULL
-            WHEN {column_expr} IN ({allowed_str}) THEN {column_expr}
-            ELSE error('Invalid {column_name}: ' || {column_expr})
-        END
+    SQL expression for the values at path in tmp_extracted.
+
+    "SystemEconomy" is a plain column, "Powers[]" every element of a list column and
+    "Factions[].Allegiance" a field of every element of a list of structs.
+    """
+    column, is_list, field = path.partition("[]")
+    if not is_list:
+        return f"[{column}]"
+    if not field:
+        return column
+    return f"list_transform({column}, x -> x{field})"
+
+def invalid_enum_values_sql(enum_fields):
     """
+    Query for the enum values of tmp_extracted that are not in the enum_values table.
 
+    All values of all enum_fields are unnested and anti-joined against enum_values in a
+    single query, rather than comparing every value (and every element of every nested
+    list) against an inline IN (...) list of the whole enum.
 
-def validate_enum_list(column_expr, allowed_values, column_name):
-    """
-    Generate a SQL expression that validates each element in a string array against allowed enum values.
-    
     Args:
-        column_expr: SQL expression returning a VARCHAR array (e.g., "CAST(message->'Powers' AS VARCHAR[])")
-        allowed_values: List of allowed string values
-        column_name: Human-readable column name for error messages
-    
+        enum_fields: list of (path, enum) pairs, see enum_path_values() for the paths and
+            db.ENUMS for the enum names
+
     Returns:
-        SQL expression that validates all array elements
+        SQL selecting (filename, rn, field, value) for every value that is not in its enum
     """
-    allowed_str = ', '.join(repr(v) for v in allowed_values)
+    values = "\n            UNION ALL\n            ".join(
+        f"SELECT filename, rn, '{path.replace('[]', '')}' AS field, '{enum}' AS enum_name, "
+        f"unnest({enum_path_values(path)}) AS value FROM tmp_extracted"
+        for path, enum in enum_fields
+    )
     return f"""
-        list_transform(
-            {column_expr},
-            x -> CASE
-                WHEN x IS NULL THEN NULL
-                WHEN x IN ({allowed_str}) THEN x
-                ELSE error('Invalid {column_name} array element: ' || x)
-            END
-        )
+        SELECT filename, rn, field, value
+        FROM (
+            {values}
+        ) v
+        ANTI JOIN enum_values USING (enum_name, value)
+        WHERE value IS NOT NULL
     """
 
+def reject_invalid_rows(conn, enum_fields, batch):
+    """
+    Moves the rows of tmp_extracted with an unknown enum value into rejected_rows.
 
-# handles both fsdjump and carrierjump
-def import_jump_jsonl_files(conn, imported):
-    for fname in sorted(os.listdir(DIR_DATA_DUMP)):
-        should_import, fpath, filesize, last_line = should_import_file(fname, imported, required_substring="Jump")
-        if not should_import:
-            continue
-        
-        print(f"Importing jump file {fname} from line {last_line+1}...")
-
-        conn.execute(f"""
-            WITH 
-            tmp_jump_raw AS ({create_temp_table(fpath)}),
-            extracted AS (
-            SELECT
-                message->>'timestamp' AS timestamp,
-                message->>'StarSystem' AS StarSystem,
-                CAST(message->>'SystemAddress' AS BIGINT) AS SystemAddress,
-                message->>'Body' AS Body,
-                CAST(message->>'BodyId' AS INTEGER) AS BodyId,
-                message->>'BodyType' AS BodyType,
-                CAST(message->>'Population' AS BIGINT) AS Population,
-                CASE 
-                    WHEN message->>'PowerplayState' = '' THEN NULL
-                    ELSE {generate_enum_check("message->>'PowerplayState'", POWERPLAYSTATE, "PowerplayState")}
-                END AS PowerplayState,
-                {generate_enum_check("message->>'ControllingPower'", POWER, "ControllingPower")} AS ControllingPower,
-                {validate_enum_list("CAST(message->>'Powers' AS VARCHAR[])", POWER, "Powers")} AS Powers,
-                message->>'PowerplayConflictProgress' AS PowerplayConflictProgress,
-                CAST(message->>'PowerplayStateControlProgress' AS DOUBLE) AS PowerplayStateControlProgress,
-                CAST(message->>'PowerplayStateReinforcement' AS INTEGER) AS PowerplayStateReinforcement,
-                CAST(message->>'PowerplayStateUndermining' AS INTEGER) AS PowerplayStateUndermining,
-                {to_faction_detail("message->>'Factions'")} AS Factions,
-                message->>'SystemFaction' AS SystemFaction,
-                {generate_enum_check(to_allegiance_enum("message->>'SystemAllegiance'"), ALLEGIANCE, "SystemAllegiance")} AS SystemAllegiance,
-                {generate_enum_check(to_economy_enum("message->>'SystemEconomy'"), ECONOMY, "SystemEconomy")} AS SystemEconomy,
-                {generate_enum_check(to_government_enum("message->>'SystemGovernment'"), GOVERNMENT, "SystemGovernment")} AS SystemGovernment,
-                {generate_enum_check(to_economy_enum("message->>'SystemSecondEconomy'"), ECONOMY, "SystemSecondEconomy")} AS SystemSecondEconomy,
-                {generate_enum_check(to_security_enum("message->>'SystemSecurity'"), SECURITY, "SystemSecurity")} AS SystemSecurity,
-                CAST(message->>'StarPos' AS DOUBLE[]) AS StarPos,
-                {to_conflict("message->'Conflicts'")} as Conflicts,
-                rn
-            FROM tmp_jump_raw
-            )
-            INSERT INTO jumps (
-                timestamp, StarSystem, SystemAddress, Body, BodyId, Population,
-                PowerplayState, ControllingPower, Powers, PowerplayConflictProgress,
-                PowerplayStateControlProgress, PowerplayStateReinforcement, PowerplayStateUndermining,
-                Factions, SystemFaction,
-                SystemAllegiance, SystemEconomy, SystemGovernment,
-                SystemSecondEconomy, SystemSecurity, StarPos, Conflicts
-            )
-            SELECT
-                timestamp, StarSystem, SystemAddress, Body, BodyId, Population,
-                PowerplayState, ControllingPower, Powers, PowerplayConflictProgress,
-                PowerplayStateControlProgress, PowerplayStateReinforcement, PowerplayStateUndermining,
-                Factions, SystemFaction,
-                SystemAllegiance, SystemEconomy, SystemGovernment,
-                SystemSecondEconomy, SystemSecurity, StarPos, Conflicts
-            FROM extracted
-            WHERE rn > ? 
-            AND (SystemSecurity IS NOT NULL AND SystemEconomy IS NOT NULL) -- bad data
-        """, [last_line])
-
-        num_lines = get_num_lines(fpath)
-        update_imported_file(conn, fname, num_lines, filesize)
-
-
-
-def import_commodity_jsonl_files(conn, imported):
-    for fname in sorted(os.listdir(DIR_DATA_DUMP)):
-        should_import, fpath, filesize, last_line = should_import_file(fname, imported, required_substring="Commodity")
-        if not should_import:
-            continue
-
-        print(f"Importing commodity file {fname} from line {last_line+1}...")
-
-        conn.execute(f"""
-            WITH 
-            tmp_commodity_raw AS ({create_temp_table(fpath)}),
-            extracted AS (
-                SELECT
-                    message->>'systemName' AS SystemName,
-                    message->>'stationName' AS StationName,
-                    {generate_enum_check(to_station_type_enum("message->>'stationType'"), STATION_TYPE, "StationType")} AS StationType,
-                    CAST(message->>'marketId' AS BIGINT) AS MarketId,
-                    CAST(message->>'timestamp' AS TIMESTAMP) AS timestamp,
-                    message->>'prohibited' AS Prohibited,
-                    {to_economy_enum_proportion("message->'economies'")} AS Economies,
-                    {generate_enum_check("message->>'carrierDockingAccess'", CARRIER_DOCKING_ACCESS, "CarrierDockingAccess")} AS CarrierDockingAccess,
-                    {to_commodities("message->'commodities'")} AS Commodities,
-                    rn
-                FROM tmp_commodity_raw
-            )
+    A new power, economy or signal type then only holds back the rows that use it, while
+    the rest of the file is imported and the file is not re-read on the next run. Once the
+    value is added to db.py, the rejected lines can be found (and re-imported) through
+    rejected_rows.
 
-            INSERT OR REPLACE INTO commodities_latest (
-                MarketId, SystemName, StationName, StationType, timestamp,
-                Prohibited, Economies, CarrierDockingAccess, Commodities
-            )
-            SELECT DISTINCT ON (MarketId) 
-                MarketId, SystemName, StationName, StationType, timestamp,
-                Prohibited, Economies, CarrierDockingAccess, Commodities
-            FROM extracted
-            WHERE rn > ?
-            ORDER BY timestamp DESC
-        """, [last_line])
-
-        num_lines = get_num_lines(fpath)
-        update_imported_file(conn, fname, num_lines, filesize)
-
-def import_approachsettlement_jsonl_files(conn, imported):
-    for fname in sorted(os.listdir(DIR_DATA_DUMP)):
-        should_import, fpath, filesize, last_line = should_import_file(fname, imported, required_substring="ApproachSettlement")
-        if not should_import:
-            continue
-        print(f"Importing approach settlement file {fname} from line {last_line+1}...")
-
-        conn.execute(f"""
-            WITH 
-            tmp_approachsettlement_raw AS ({create_temp_table(fpath)}),
-            extracted AS (
-                SELECT
-                    message->>'timestamp' AS timestamp,
-                    message->>'StarSystem' AS StarSystem,
-                    CAST(message->>'SystemAddress' AS BIGINT) AS SystemAddress,
-                    message->>'Body' AS Body,
-                    CAST(message->>'BodyId' AS INTEGER) AS BodyId,
-                    message->>'BodyName' AS BodyName,
-                    CAST(message->>'Latitude' AS DOUBLE) AS Latitude,
-                    CAST(message->>'Longitude' AS DOUBLE) AS Longitude,
-                    CAST(message->>'MarketID' AS BIGINT) AS MarketId,
-                    message->>'Name' AS Name,
-                    CAST(message->>'StarPos' AS DOUBLE[]) AS StarPos,
-                    {generate_enum_check("message->>'StationAllegiance'", ALLEGIANCE, "StationAllegiance")} AS StationAllegiance,
-                    {to_economy_enum_proportion("message->'StationEconomies'")} AS StationEconomies,
-                    {generate_enum_check(to_economy_enum("message->>'StationEconomy'"), ECONOMY, "StationEconomy")} AS StationEconomy,
-                    {to_faction_state("message->'StationFaction'")} AS StationFaction,
-                    {generate_enum_check(to_government_enum("message->>'StationGovernment'"), GOVERNMENT, "StationGovernment")} AS StationGovernment,
-                    CAST(message->'StationServices' AS VARCHAR[]) AS StationServices,
-                    rn
-                FROM tmp_approachsettlement_raw
-            )
-            INSERT INTO approach_settlement (
-                timestamp, StarSystem, SystemAddress, Body, BodyId, BodyName,
-                Latitude, Longitude, MarketId, Name, StarPos,
-                StationAllegiance, StationEconomies, StationEconomy,
-                StationFaction, StationGovernment, StationServices
-            )
-            SELECT
-                timestamp, StarSystem, SystemAddress, Body, BodyId, BodyName,
-                Latitude, Longitude, MarketId, Name, StarPos,
-                StationAllegiance, StationEconomies, StationEconomy,
-                StationFaction, StationGovernment, StationServices
-            FROM extracted
-            WHERE rn > ?
-        """, [last_line])
-
-        num_lines = get_num_lines(fpath)
-        update_imported_file(conn, fname, num_lines, filesize)
-
-def import_docked_jsonl_files(conn, imported):
-    for fname in sorted(os.listdir(DIR_DATA_DUMP)):
-        should_import, fpath, filesize, last_line = should_import_file(fname, imported, required_substring="Docked")
-        if not should_import:
-            continue
-        print(f"Importing docked file {fname} from line {last_line+1}...")
-
-        conn.execute(f"""
-            WITH 
-            tmp_docked_raw AS ({create_temp_table(fpath)}),
-            extracted AS (
-                SELECT
-                    CAST(message->>'timestamp' AS TIMESTAMP) AS timestamp,
-                    message->>'StarSystem' AS StarSystem,
-                    CAST(message->>'SystemAddress' AS BIGINT) AS SystemAddress,
-                    message->>'StationName' AS StationName,
-                    {generate_enum_check(to_station_type_enum("message->>'stationType'"), STATION_TYPE, "StationType")} AS StationType,
-                    CAST(message->>'MarketID' AS BIGINT) AS MarketID,
-                    CAST(message->>'DistFromStarLS' AS DOUBLE) AS DistFromStarLS,
-                    CAST(message->>'StarPos' AS DOUBLE[]) AS StarPos,
-                    {generate_enum_check("message->>'StationAllegiance'", ALLEGIANCE, "StationAllegiance")} AS StationAllegiance,
-                    {to_economy_enum_proportion("message->'StationEconomies'")} AS StationEconomies,
-                    {generate_enum_check(to_economy_enum("message->>'StationEconomy'"), ECONOMY, "StationEconomy")} AS StationEconomy,
-                    {to_faction_state("message->'StationFaction'")} AS StationFaction,
-                    {generate_enum_check(to_government_enum("message->>'StationGovernment'"), GOVERNMENT, "StationGovernment")} AS StationGovernment,
-                    CAST(message->'StationServices' AS VARCHAR[]) AS StationServices,
-                    CAST(message->'LandingPads' AS STRUCT(Large INTEGER, Medium INTEGER, Small INTEGER)) AS LandingPads,
-                    rn
-                FROM tmp_docked_raw
-            )
-            INSERT INTO docked (
-                timestamp, StarSystem, SystemAddress, StationName, StationType, MarketID,
-                DistFromStarLS, StarPos, StationEconomies, StationEconomy,
-                StationFaction, StationGovernment, StationServices, LandingPads
-            )
-            SELECT
-                timestamp, StarSystem, SystemAddress, StationName, StationType, MarketID,
-                DistFromStarLS, StarPos, StationEconomies, StationEconomy, 
-                StationFaction, StationGovernment, StationServices, LandingPads
-            FROM extracted
-            WHERE rn > ?
-        """, [last_line])
-
-        num_lines = get_num_lines(fpath)
-        update_imported_file(conn, fname, num_lines, filesize)
-
-# def import_fssbodysignals_jsonl_files(conn, imported):
-#     for fname in sorted(os.listdir(DIR_DATA_DUMP)):
-#         should_import, fpath, filesize, last_line = should_import_file(fname, imported, required_substring="FSSBodySignals")
-#         if not should_import:
-#             continue
-#         print(f"Importing FSSBodySignals file {fname} from line {last_line+1}...")
-
-#         conn.execute(f"""
-#             WITH 
-#             tmp_fssbodysignals_raw AS ({create_temp_table(fpath)}),
-#             extracted AS (
-#                 SELECT
-#                     CAST(message->>'timestamp' AS TIMESTAMP) AS timestamp,
-#                     message->>'StarSystem' AS StarSystem,
-#                     CAST(message->>'SystemAddress' AS BIGINT) AS SystemAddress,
-#                     CAST(message->>'BodyId' AS INTEGER) AS BodyId,
-#                     message->>'BodyName' AS BodyName,
-#                     {to_count_signal_type_enum("message->'Signals'")} AS Signals,
-#                     CAST(message->>'StarPos' AS DOUBLE[]) AS StarPos,
-#                     rn
-#                 FROM tmp_fssbodysignals_raw
-#             )
-#             INSERT INTO fssbodysignals (
-#                 timestamp, StarSystem, SystemAddress, BodyId, BodyName, Signals, StarPos
-#             )
-#             SELECT
-#                 timestamp, StarSystem, SystemAddress, BodyId, BodyName, Signals, StarPos
-#             FROM extracted
-#             WHERE rn > ?
-#         """, [last_line])
-
-#         num_lines = get_num_lines(fpath)
-#         update_imported_file(conn, fname, num_lines, filesize)
-
-
-def import_location_jsonl_files(conn, imported):
-    for fname in sorted(os.listdir(DIR_DATA_DUMP)):
-        should_import, fpath, filesize, last_line = should_import_file(fname, imported, required_substring="Location")
-        if not should_import:
-            continue
-
-        print(f"Importing Location file {fname} from line {last_line+1}...")
-
-        conn.execute(f"""
-            WITH 
-            tmp_location_raw AS ({create_temp_table(fpath)}),
-            extracted AS (
-                SELECT
-                    CAST(message->>'timestamp' AS TIMESTAMP) AS timestamp,
-                    message->>'StarSystem' AS StarSystem,
-                    CAST(message->>'SystemAddress' AS BIGINT) AS SystemAddress,
-                    message->>'Body' AS Body,
-                    CAST(message->>'BodyId' AS INTEGER) AS BodyId,
-                    {generate_enum_check("message->>'BodyType'", BODY_TYPE, "BodyType")} AS BodyType,
-                    CAST(message->>'DistFromStarLS' AS DOUBLE) AS DistFromStarLS,
-                    CAST(message->>'Docked' AS BOOLEAN) AS Docked,
-                    CAST(message->>'MarketID' AS BIGINT) AS MarketID,
-                    CAST(message->>'Population' AS BIGINT) AS Population,
-                    CASE WHEN message->>'PowerplayState' = '' THEN NULL ELSE {generate_enum_check("message->>'PowerplayState'", POWERPLAYSTATE, "PowerplayState")} END AS PowerplayState,
-                    {generate_enum_check("message->>'ControllingPower'", POWER, "ControllingPower")} AS ControllingPower,
-                    {validate_enum_list("CAST(message->>'Powers' AS VARCHAR[])", POWER, "Powers")} AS Powers,
-                    message->>'PowerplayConflictProgress' AS PowerplayConflictProgress,
-                    CAST(message->>'PowerplayStateControlProgress' AS DOUBLE) AS PowerplayStateControlProgress,
-                    CAST(message->>'PowerplayStateReinforcement' AS INTEGER) AS PowerplayStateReinforcement,
-                    CAST(message->>'PowerplayStateUndermining' AS INTEGER) AS PowerplayStateUndermining,
-                    CAST(message->>'StarPos' AS DOUBLE[]) AS StarPos,
-                    {to_economy_enum_proportion("message->'StationEconomies'")} AS StationEconomies,
-                    {generate_enum_check(to_economy_enum("message->>'StationEconomy'"), ECONOMY, "StationEconomy")} AS StationEconomy,
-                    {to_faction_state("message->'StationFaction'")} AS StationFaction,
-                    {generate_enum_check(to_government_enum("message->>'StationGovernment'"), GOVERNMENT, "StationGovernment")} AS StationGovernment,
-                    message->>'StationName' AS StationName,
-                    CAST(message->'StationServices' AS VARCHAR[]) AS StationServices,
-                    {generate_enum_check("message->>'StationType'", STATION_TYPE, "StationType")} AS StationType,
-                    {generate_enum_check(to_allegiance_enum("message->>'SystemAllegiance'"), ALLEGIANCE, "SystemAllegiance")} AS SystemAllegiance,
-                    {generate_enum_check(to_economy_enum("message->>'SystemEconomy'"), ECONOMY, "SystemEconomy")} AS SystemEconomy,
-                    {to_faction_state("message->'SystemFaction'")} AS SystemFaction,
-                    {generate_enum_check(to_government_enum("message->>'SystemGovernment'"), GOVERNMENT, "SystemGovernment")} AS SystemGovernment,
-                    {generate_enum_check(to_economy_enum("message->>'SystemSecondEconomy'"), ECONOMY, "SystemSecondEconomy")} AS SystemSecondEconomy,
-                    {generate_enum_check(to_security_enum("message->>'SystemSecurity'"), SECURITY, "SystemSecurity")} AS SystemSecurity,
-                    {to_conflict("message->'Conflicts'")} as Conflicts,
-                    rn
-                FROM tmp_location_raw
-            )
-            INSERT INTO location (
-                timestamp, StarSystem, SystemAddress, Body, BodyId, BodyType,
-                DistFromStarLS, Docked, MarketID, Population, 
-                PowerplayState, ControllingPower, Powers, PowerplayConflictProgress,
-                PowerplayStateControlProgress, PowerplayStateReinforcement, PowerplayStateUndermining,
-                StarPos,
-                StationEconomies, StationEconomy, StationFaction, StationGovernment,
-                StationName, StationServices, StationType, SystemAllegiance, SystemEconomy,
-                SystemFaction, SystemGovernment, SystemSecondEconomy, SystemSecurity, Conflicts
-            )
-            SELECT
-                timestamp, StarSystem, SystemAddress, Body, BodyId, BodyType,
-                DistFromStarLS, Docked, MarketID, Population, 
-                PowerplayState, ControllingPower, Powers, PowerplayConflictProgress,
-                PowerplayStateControlProgress, PowerplayStateReinforcement, PowerplayStateUndermining,
-                StarPos,
-                StationEconomies, StationEconomy, StationFaction, StationGovernment,
-                StationName, StationServices, StationType, SystemAllegiance, SystemEconomy,
-                SystemFaction, SystemGovernment, SystemSecondEconomy, SystemSecurity, Conflicts
-            FROM extracted
-            WHERE rn > ?
-            AND (SystemSecurity IS NOT NULL AND SystemEconomy IS NOT NULL) -- bad data
-        """, [last_line])
-
-        num_lines = get_num_lines(fpath)
-        update_imported_file(conn, fname, num_lines, filesize)
-
-def import_saasignalsfound_jsonl_files(conn, imported):
-    for fname in sorted(os.listdir(DIR_DATA_DUMP)):
-        should_import, fpath, filesize, last_line = should_import_file(fname, imported, required_substring="SAASignalsFound")
-        if not should_import:
-            continue
-        print(f"Importing SAASignalsFound file {fname} from line {last_line+1}...")
-
-        conn.execute(f"""
-            WITH 
-            tmp_saasignalsfound_raw AS ({create_temp_table(fpath)}),
-            extracted AS (
-                SELECT
-                    CAST(message->>'timestamp' AS TIMESTAMP) AS timestamp,
-                    message->>'StarSystem' AS StarSystem,
-                    CAST(message->>'SystemAddress' AS BIGINT) AS SystemAddress,
-                    CAST(message->>'BodyID' AS INTEGER) AS BodyId,
-                    message->>'BodyName' AS BodyName,
-                    list_transform(CAST(message->'Genuses' AS JSON[]), x -> struct_pack(Genus := x->>'Genus')) AS Genuses,
-                    {to_count_signal_type_enum("message->'Signals'")} AS Signals,
-                    CAST(message->>'StarPos' AS DOUBLE[]) AS StarPos,
-                    rn
-                FROM tmp_saasignalsfound_raw
-            )
-            INSERT INTO saasignalsfound (
-                timestamp, StarSystem, SystemAddress, BodyId, BodyName,
-                Genuses, Signals, StarPos
-            )
-            SELECT
-                timestamp, StarSystem, SystemAddress, BodyId, BodyName,
-                Genuses, Signals, StarPos
-            FROM extracted
-            WHERE rn > ?
-        """, [last_line])
-
-        num_lines = get_num_lines(fpath)
-        update_imported_file(conn, fname, num_lines, filesize)
-
-def import_fsssignaldiscovered_jsonl_files(conn, imported):
-    for fname in sorted(os.listdir(DIR_DATA_DUMP)):
-        should_import, fpath, filesize, last_line = should_import_file(fname, imported, required_substring="FSSSignalDiscovered")
-        if not should_import:
-            continue
-        print(f"Importing fsssignaldiscovered file {fname} from line {last_line+1}...")
-
-        conn.execute(f"""
-            WITH 
-            tmp_fsssignaldiscovered_raw AS ({create_temp_table(fpath)}),
-            extracted AS (
-                SELECT
-                    CAST(message->>'timestamp' AS TIMESTAMP) AS timestamp,
-                    message->>'StarSystem' AS StarSystem,
-                    CAST(message->>'SystemAddress' AS BIGINT) AS SystemAddress,
-                    list_transform(
-                        CAST(message->'signals' AS JSON[]),
-                        s -> struct_pack(
-                            IsStation := s->>'IsStation' = 'true',
-                            SignalName := s->>'SignalName',
-                            SignalType := {generate_enum_check("CASE WHEN s ->>'SignalType' = '' THEN 'Empty' ELSE s->>'SignalType' END", FSS_SIGNAL_TYPE, "SignalType")}
-                        )
-                    ) AS Signals,
-                    rn
-                FROM tmp_fsssignaldiscovered_raw
-            )
-            INSERT OR REPLACE INTO fsssignaldiscovered_latest (
-                timestamp, StarSystem, SystemAddress, Signals
-            )
-            SELECT
-                DISTINCT ON (SystemAddress) timestamp, StarSystem, SystemAddress, Signals
-            FROM extracted
-            WHERE rn > ?
-            ORDER BY timestamp DESC
-        """, [last_line])
+    Returns:
+        number of rejected rows per file name
+    """
+    if not enum_fields:
+        return {}
+    sources = ", ".join(
+        f"({sql_string(source['path'])}, {sql_string(fname)}, {int(source['lines_before'])})"
+        for fname, _, source in batch
+    )
+    conn.execute(f"CREATE OR REPLACE TEMP TABLE tmp_rejected AS {invalid_enum_values_sql(enum_fields)}")
+    conn.execute(f"""
+        INSERT INTO rejected_rows (filename, line, field, value)
+        SELECT sources.fname, sources.lines_before + rn, field, value
+        FROM tmp_rejected
+        JOIN (VALUES {sources}) sources(filename, fname, lines_before) USING (filename)
+        ORDER BY sources.fname, rn
+    """)
+    conn.execute("DELETE FROM tmp_extracted WHERE (filename, rn) IN (SELECT filename, rn FROM tmp_rejected)")
+    rejected = conn.execute("""
+        SELECT filename, count(DISTINCT rn) FROM tmp_rejected GROUP BY filename
+    """).fetchall()
+    conn.execute("DROP TABLE IF EXISTS tmp_rejected")
+    names = {source["path"]: fname for fname, _, source in batch}
+    return {names[path]: count for path, count in rejected}
 
-        num_lines = get_num_lines(fpath)
-        update_imported_file(conn, fname, num_lines, filesize)
+
+# handles both fsdjump and carrierjump
+def import_jump_jsonl_files(conn, imported, batch_size=None, dedup_window=DEDUP_WINDOW_SECONDS):
+    import_jsonl_files(conn, imported, "Jump", "jump", message_schema(
+        [
+            "timestamp", "StarSystem", "SystemAddress", "Body", "BodyId", "Population",
+            "PowerplayState", "ControllingPower", "Powers", "PowerplayConflictProgress",
+            "PowerplayStateControlProgress", "PowerplayStateReinforcement",
+            "PowerplayStateUndermining", "Factions", "SystemFaction", "SystemAllegiance",
+            "SystemEconomy", "SystemGovernment", "SystemSecondEconomy", "SystemSecurity",
+            "StarPos"
+        ],
+        ["Conflicts"],
+    ), f"""
+        WITH tmp_jump_raw AS ({select_valid_rows()})
+        SELECT
+            message.timestamp AS timestamp,
+            message.StarSystem AS StarSystem,
+            CAST(message.SystemAddress AS BIGINT) AS SystemAddress,
+            message.Body AS Body,
+            CAST(message.BodyId AS INTEGER) AS BodyId,
+            CAST(message.Population AS BIGINT) AS Population,
+            CASE 
+                WHEN message.PowerplayState = '' THEN NULL
+                ELSE {to_enum_value("message.PowerplayState")}
+            END AS PowerplayState,
+            {to_enum_value("message.ControllingPower")} AS ControllingPower,
+            CAST(message.Powers AS VARCHAR[]) AS Powers,
+            message.PowerplayConflictProgress AS PowerplayConflictProgress,
+            CAST(message.PowerplayStateControlProgress AS DOUBLE) AS PowerplayStateControlProgress,
+            CAST(message.PowerplayStateReinforcement AS INTEGER) AS PowerplayStateReinforcement,
+            CAST(message.PowerplayStateUndermining AS INTEGER) AS PowerplayStateUndermining,
+            {to_faction_detail("message.Factions")} AS Factions,
+            message.SystemFaction AS SystemFaction,
+            {to_enum_value(to_allegiance_enum("message.SystemAllegiance"))} AS SystemAllegiance,
+            {to_enum_value(to_economy_enum("message.SystemEconomy"))} AS SystemEconomy,
+            {to_enum_value(to_government_enum("message.SystemGovernment"))} AS SystemGovernment,
+            {to_enum_value(to_economy_enum("message.SystemSecondEconomy"))} AS SystemSecondEconomy,
+            {to_enum_value(to_security_enum("message.SystemSecurity"))} AS SystemSecurity,
+            CAST(message.StarPos AS DOUBLE[]) AS StarPos,
+            {to_conflict("message.Conflicts")} as Conflicts,
+            filename,
+            rn
+        FROM tmp_jump_raw
+    """, [
+        ("PowerplayState", "POWERPLAYSTATE"),
+        ("ControllingPower", "POWER"),
+        ("Powers[]", "POWER"),
+        ("SystemAllegiance", "ALLEGIANCE"),
+        ("SystemEconomy", "ECONOMY"),
+        ("SystemGovernment", "GOVERNMENT"),
+        ("SystemSecondEconomy", "ECONOMY"),
+        ("SystemSecurity", "SECURITY"),
+    ] + FACTION_DETAIL_ENUMS + CONFLICT_ENUMS, f"""
+        INSERT INTO jumps (
+            timestamp, StarSystem, SystemAddress, Body, BodyId, Population,
+            PowerplayState, ControllingPower, Powers, PowerplayConflictProgress,
+            PowerplayStateControlProgress, PowerplayStateReinforcement, PowerplayStateUndermining,
+            Factions, SystemFaction,
+            SystemAllegiance, SystemEconomy, SystemGovernment,
+            SystemSecondEconomy, SystemSecurity, StarPos, Conflicts, ContentHash
+        )
+        SELECT
+            timestamp, StarSystem, SystemAddress, Body, BodyId, Population,
+            PowerplayState, ControllingPower, Powers, PowerplayConflictProgress,
+            PowerplayStateControlProgress, PowerplayStateReinforcement, PowerplayStateUndermining,
+            Factions, SystemFaction,
+            SystemAllegiance, SystemEconomy, SystemGovernment,
+            SystemSecondEconomy, SystemSecurity, StarPos, Conflicts, ContentHash
+        FROM tmp_extracted
+        WHERE (SystemSecurity IS NOT NULL AND SystemEconomy IS NOT NULL) -- bad data
+    """, batch_size, dedup_table="jumps", dedup_window=dedup_window)
+
+
+
+def import_commodity_jsonl_files(conn, imported, batch_size=None, dedup_window=DEDUP_WINDOW_SECONDS):
+    import_jsonl_files(conn, imported, "Commodity", "commodity", message_schema(
+        [
+            "systemName", "stationName", "stationType", "marketId", "timestamp", "prohibited",
+            "carrierDockingAccess"
+        ],
+        ["economies", "commodities"],
+    ), f"""
+        WITH tmp_commodity_raw AS ({select_valid_rows()})
+        SELECT
+            message.systemName AS SystemName,
+            message.stationName AS StationName,
+            {to_enum_value(to_station_type_enum("message.stationType"))} AS StationType,
+            CAST(message.marketId AS BIGINT) AS MarketId,
+            CAST(message.timestamp AS TIMESTAMP) AS timestamp,
+            message.prohibited AS Prohibited,
+            {to_economy_enum_proportion("message.economies")} AS Economies,
+            {to_enum_value("message.carrierDockingAccess")} AS CarrierDockingAccess,
+            {to_commodities("message.commodities")} AS Commodities,
+            filename,
+            rn
+        FROM tmp_commodity_raw
+    """, [
+        ("StationType", "STATION_TYPE"),
+        ("CarrierDockingAccess", "CARRIER_DOCKING_ACCESS"),
+    ] + economy_proportion_enums("Economies") + COMMODITY_ENUMS, f"""
+        INSERT OR REPLACE INTO commodities_latest (
+            MarketId, SystemName, StationName, StationType, timestamp,
+            Prohibited, Economies, CarrierDockingAccess, Commodities
+        )
+        SELECT DISTINCT ON (MarketId) 
+            MarketId, SystemName, StationName, StationType, timestamp,
+            Prohibited, Economies, CarrierDockingAccess, Commodities
+        FROM tmp_extracted
+        ORDER BY timestamp DESC
+    """, batch_size)
+
+def import_approachsettlement_jsonl_files(conn, imported, batch_size=None, dedup_window=DEDUP_WINDOW_SECONDS):
+    import_jsonl_files(conn, imported, "ApproachSettlement", "approach settlement", message_schema(
+        [
+            "timestamp", "StarSystem", "SystemAddress", "Body", "BodyId", "BodyName",
+            "Latitude", "Longitude", "MarketID", "Name", "StarPos", "StationAllegiance",
+            "StationEconomy", "StationGovernment"
+        ],
+        ["StationEconomies", "StationFaction", "StationServices"],
+    ), f"""
+        WITH tmp_approachsettlement_raw AS ({select_valid_rows()})
+        SELECT
+            message.timestamp AS timestamp,
+            message.StarSystem AS StarSystem,
+            CAST(message.SystemAddress AS BIGINT) AS SystemAddress,
+            message.Body AS Body,
+            CAST(message.BodyId AS INTEGER) AS BodyId,
+            message.BodyName AS BodyName,
+            CAST(message.Latitude AS DOUBLE) AS Latitude,
+            CAST(message.Longitude AS DOUBLE) AS Longitude,
+            CAST(message.MarketID AS BIGINT) AS MarketId,
+            message.Name AS Name,
+            CAST(message.StarPos AS DOUBLE[]) AS StarPos,
+            {to_enum_value("message.StationAllegiance")} AS StationAllegiance,
+            {to_economy_enum_proportion("message.StationEconomies")} AS StationEconomies,
+            {to_enum_value(to_economy_enum("message.StationEconomy"))} AS StationEconomy,
+            {to_faction_state("message.StationFaction")} AS StationFaction,
+            {to_enum_value(to_government_enum("message.StationGovernment"))} AS StationGovernment,
+            CAST(message.StationServices AS VARCHAR[]) AS StationServices,
+            filename,
+            rn
+        FROM tmp_approachsettlement_raw
+    """, [
+        ("StationAllegiance", "ALLEGIANCE"),
+        ("StationEconomy", "ECONOMY"),
+        ("StationGovernment", "GOVERNMENT"),
+    ] + economy_proportion_enums("StationEconomies"), f"""
+        INSERT INTO approach_settlement (
+            timestamp, StarSystem, SystemAddress, Body, BodyId, BodyName,
+            Latitude, Longitude, MarketId, Name, StarPos,
+            StationAllegiance, StationEconomies, StationEconomy,
+            StationFaction, StationGovernment, StationServices
+        )
+        SELECT
+            timestamp, StarSystem, SystemAddress, Body, BodyId, BodyName,
+            Latitude, Longitude, MarketId, Name, StarPos,
+            StationAllegiance, StationEconomies, StationEconomy,
+            StationFaction, StationGovernment, StationServices
+        FROM tmp_extracted
+    """, batch_size)
+
+def import_docked_jsonl_files(conn, imported, batch_size=None, dedup_window=DEDUP_WINDOW_SECONDS):
+    import_jsonl_files(conn, imported, "Docked", "docked", message_schema(
+        [
+            "timestamp", "StarSystem", "SystemAddress", "StationName", "stationType",
+            "MarketID", "DistFromStarLS", "StarPos", "StationAllegiance", "StationEconomy",
+            "StationGovernment"
+        ],
+        ["StationEconomies", "StationFaction", "StationServices", "LandingPads"],
+    ), f"""
+        WITH tmp_docked_raw AS ({select_valid_rows()})
+        SELECT
+            CAST(message.timestamp AS TIMESTAMP) AS timestamp,
+            message.StarSystem AS StarSystem,
+            CAST(message.SystemAddress AS BIGINT) AS SystemAddress,
+            message.StationName AS StationName,
+            {to_enum_value(to_station_type_enum("message.stationType"))} AS StationType,
+            CAST(message.MarketID AS BIGINT) AS MarketID,
+            CAST(message.DistFromStarLS AS DOUBLE) AS DistFromStarLS,
+            CAST(message.StarPos AS DOUBLE[]) AS StarPos,
+            {to_enum_value("message.StationAllegiance")} AS StationAllegiance,
+            {to_economy_enum_proportion("message.StationEconomies")} AS StationEconomies,
+            {to_enum_value(to_economy_enum("message.StationEconomy"))} AS StationEconomy,
+            {to_faction_state("message.StationFaction")} AS StationFaction,
+            {to_enum_value(to_government_enum("message.StationGovernment"))} AS StationGovernment,
+            CAST(message.StationServices AS VARCHAR[]) AS StationServices,
+            CAST(message.LandingPads AS STRUCT(Large INTEGER, Medium INTEGER, Small INTEGER)) AS LandingPads,
+            filename,
+            rn
+        FROM tmp_docked_raw
+    """, [
+        ("StationType", "STATION_TYPE"),
+        ("StationAllegiance", "ALLEGIANCE"),
+        ("StationEconomy", "ECONOMY"),
+        ("StationGovernment", "GOVERNMENT"),
+    ] + economy_proportion_enums("StationEconomies"), f"""
+        INSERT INTO docked (
+            timestamp, StarSystem, SystemAddress, StationName, StationType, MarketID,
+            DistFromStarLS, StarPos, StationEconomies, StationEconomy,
+            StationFaction, StationGovernment, StationServices, LandingPads, ContentHash
+        )
+        SELECT
+            timestamp, StarSystem, SystemAddress, StationName, StationType, MarketID,
+            DistFromStarLS, StarPos, StationEconomies, StationEconomy, 
+            StationFaction, StationGovernment, StationServices, LandingPads, ContentHash
+        FROM tmp_extracted
+    """, batch_size, dedup_table="docked", dedup_window=dedup_window)
+
+# def import_fssbodysignals_jsonl_files(conn, imported, batch_size=None, dedup_window=DEDUP_WINDOW_SECONDS):
+#     import_jsonl_files(conn, imported, "FSSBodySignals", "FSSBodySignals", message_schema(
+#         ["timestamp", "StarSystem", "SystemAddress", "BodyId", "BodyName", "StarPos"],
+#         ["Signals"],
+#     ), f"""
+#         WITH tmp_fssbodysignals_raw AS ({select_valid_rows()})
+#         SELECT
+#             CAST(message.timestamp AS TIMESTAMP) AS timestamp,
+#             message.StarSystem AS StarSystem,
+#             CAST(message.SystemAddress AS BIGINT) AS SystemAddress,
+#             CAST(message.BodyId AS INTEGER) AS BodyId,
+#             message.BodyName AS BodyName,
+#             {to_count_signal_type_enum("message.Signals")} AS Signals,
+#             CAST(message.StarPos AS DOUBLE[]) AS StarPos,
+#             filename,
+#             rn
+#         FROM tmp_fssbodysignals_raw
+#     """, COUNT_SIGNAL_TYPE_ENUMS, f"""
+#         INSERT INTO fssbodysignals (
+#             timestamp, StarSystem, SystemAddress, BodyId, BodyName, Signals, StarPos
+#         )
+#         SELECT
+#             timestamp, StarSystem, SystemAddress, BodyId, BodyName, Signals, StarPos
+#         FROM tmp_extracted
+#     """, batch_size)
+
+
+def import_location_jsonl_files(conn, imported, batch_size=None, dedup_window=DEDUP_WINDOW_SECONDS):
+    import_jsonl_files(conn, imported, "Location", "Location", message_schema(
+        [
+            "timestamp", "StarSystem", "SystemAddress", "Body", "BodyId", "BodyType",
+            "DistFromStarLS", "Docked", "MarketID", "Population", "PowerplayState",
+            "ControllingPower", "Powers", "PowerplayConflictProgress",
+            "PowerplayStateControlProgress", "PowerplayStateReinforcement",
+            "PowerplayStateUndermining", "StarPos", "StationEconomy", "StationGovernment",
+            "StationName", "StationType", "SystemAllegiance", "SystemEconomy",
+            "SystemGovernment", "SystemSecondEconomy", "SystemSecurity"
+        ],
+        [
+            "StationEconomies", "StationFaction", "StationServices", "SystemFaction",
+            "Conflicts"
+        ],
+    ), f"""
+        WITH tmp_location_raw AS ({select_valid_rows()})
+        SELECT
+            CAST(message.timestamp AS TIMESTAMP) AS timestamp,
+            message.StarSystem AS StarSystem,
+            CAST(message.SystemAddress AS BIGINT) AS SystemAddress,
+            message.Body AS Body,
+            CAST(message.BodyId AS INTEGER) AS BodyId,
+            {to_enum_value("message.BodyType")} AS BodyType,
+            CAST(message.DistFromStarLS AS DOUBLE) AS DistFromStarLS,
+            CAST(message.Docked AS BOOLEAN) AS Docked,
+            CAST(message.MarketID AS BIGINT) AS MarketID,
+            CAST(message.Population AS BIGINT) AS Population,
+            CASE WHEN message.PowerplayState = '' THEN NULL ELSE {to_enum_value("message.PowerplayState")} END AS PowerplayState,
+            {to_enum_value("message.ControllingPower")} AS ControllingPower,
+            CAST(message.Powers AS VARCHAR[]) AS Powers,
+            message.PowerplayConflictProgress AS PowerplayConflictProgress,
+            CAST(message.PowerplayStateControlProgress AS DOUBLE) AS PowerplayStateControlProgress,
+            CAST(message.PowerplayStateReinforcement AS INTEGER) AS PowerplayStateReinforcement,
+            CAST(message.PowerplayStateUndermining AS INTEGER) AS PowerplayStateUndermining,
+            CAST(message.StarPos AS DOUBLE[]) AS StarPos,
+            {to_economy_enum_proportion("message.StationEconomies")} AS StationEconomies,
+            {to_enum_value(to_economy_enum("message.StationEconomy"))} AS StationEconomy,
+            {to_faction_state("message.StationFaction")} AS StationFaction,
+            {to_enum_value(to_government_enum("message.StationGovernment"))} AS StationGovernment,
+            message.StationName AS StationName,
+            CAST(message.StationServices AS VARCHAR[]) AS StationServices,
+            {to_enum_value("message.StationType")} AS StationType,
+            {to_enum_value(to_allegiance_enum("message.SystemAllegiance"))} AS SystemAllegiance,
+            {to_enum_value(to_economy_enum("message.SystemEconomy"))} AS SystemEconomy,
+            {to_faction_state("message.SystemFaction")} AS SystemFaction,
+            {to_enum_value(to_government_enum("message.SystemGovernment"))} AS SystemGovernment,
+            {to_enum_value(to_economy_enum("message.SystemSecondEconomy"))} AS SystemSecondEconomy,
+            {to_enum_value(to_security_enum("message.SystemSecurity"))} AS SystemSecurity,
+            {to_conflict("message.Conflicts")} as Conflicts,
+            filename,
+            rn
+        FROM tmp_location_raw
+    """, [
+        ("BodyType", "BODY_TYPE"),
+        ("PowerplayState", "POWERPLAYSTATE"),
+        ("ControllingPower", "POWER"),
+        ("Powers[]", "POWER"),
+        ("StationEconomy", "ECONOMY"),
+        ("StationGovernment", "GOVERNMENT"),
+        ("StationType", "STATION_TYPE"),
+        ("SystemAllegiance", "ALLEGIANCE"),
+        ("SystemEconomy", "ECONOMY"),
+        ("SystemGovernment", "GOVERNMENT"),
+        ("SystemSecondEconomy", "ECONOMY"),
+        ("SystemSecurity", "SECURITY"),
+    ] + economy_proportion_enums("StationEconomies") + CONFLICT_ENUMS, f"""
+        INSERT INTO location (
+            timestamp, StarSystem, SystemAddress, Body, BodyId, BodyType,
+            DistFromStarLS, Docked, MarketID, Population, 
+            PowerplayState, ControllingPower, Powers, PowerplayConflictProgress,
+            PowerplayStateControlProgress, PowerplayStateReinforcement, PowerplayStateUndermining,
+            StarPos,
+            StationEconomies, StationEconomy, StationFaction, StationGovernment,
+            StationName, StationServices, StationType, SystemAllegiance, SystemEconomy,
+            SystemFaction, SystemGovernment, SystemSecondEconomy, SystemSecurity, Conflicts, ContentHash
+        )
+        SELECT
+            timestamp, StarSystem, SystemAddress, Body, BodyId, BodyType,
+            DistFromStarLS, Docked, MarketID, Population, 
+            PowerplayState, ControllingPower, Powers, PowerplayConflictProgress,
+            PowerplayStateControlProgress, PowerplayStateReinforcement, PowerplayStateUndermining,
+            StarPos,
+            StationEconomies, StationEconomy, StationFaction, StationGovernment,
+            StationName, StationServices, StationType, SystemAllegiance, SystemEconomy,
+            SystemFaction, SystemGovernment, SystemSecondEconomy, SystemSecurity, Conflicts, ContentHash
+        FROM tmp_extracted
+        WHERE (SystemSecurity IS NOT NULL AND SystemEconomy IS NOT NULL) -- bad data
+    """, batch_size, dedup_table="location", dedup_window=dedup_window)
+
+def import_saasignalsfound_jsonl_files(conn, imported, batch_size=None, dedup_window=DEDUP_WINDOW_SECONDS):
+    import_jsonl_files(conn, imported, "SAASignalsFound", "SAASignalsFound", message_schema(
+        ["timestamp", "StarSystem", "SystemAddress", "BodyID", "BodyName", "StarPos"],
+        ["Genuses", "Signals"],
+    ), f"""
+        WITH tmp_saasignalsfound_raw AS ({select_valid_rows()})
+        SELECT
+            CAST(message.timestamp AS TIMESTAMP) AS timestamp,
+            message.StarSystem AS StarSystem,
+            CAST(message.SystemAddress AS BIGINT) AS SystemAddress,
+            CAST(message.BodyID AS INTEGER) AS BodyId,
+            message.BodyName AS BodyName,
+            list_transform(CAST(message.Genuses AS JSON[]), x -> struct_pack(Genus := x->>'Genus')) AS Genuses,
+            {to_count_signal_type_enum("message.Signals")} AS Signals,
+            CAST(message.StarPos AS DOUBLE[]) AS StarPos,
+            filename,
+            rn
+        FROM tmp_saasignalsfound_raw
+    """, COUNT_SIGNAL_TYPE_ENUMS, f"""
+        INSERT INTO saasignalsfound (
+            timestamp, StarSystem, SystemAddress, BodyId, BodyName,
+            Genuses, Signals, StarPos
+        )
+        SELECT
+            timestamp, StarSystem, SystemAddress, BodyId, BodyName,
+            Genuses, Signals, StarPos
+        FROM tmp_extracted
+    """, batch_size)
+
+def import_fsssignaldiscovered_jsonl_files(conn, imported, batch_size=None, dedup_window=DEDUP_WINDOW_SECONDS):
+    import_jsonl_files(conn, imported, "FSSSignalDiscovered", "fsssignaldiscovered", message_schema(
+        ["timestamp", "StarSystem", "SystemAddress"],
+        ["signals"],
+    ), f"""
+        WITH tmp_fsssignaldiscovered_raw AS ({select_valid_rows()})
+        SELECT
+            CAST(message.timestamp AS TIMESTAMP) AS timestamp,
+            message.StarSystem AS StarSystem,
+            CAST(message.SystemAddress AS BIGINT) AS SystemAddress,
+            list_transform(
+                CAST(message.signals AS JSON[]),
+                s -> struct_pack(
+                    IsStation := s->>'IsStation' = 'true',
+                    SignalName := s->>'SignalName',
+                    SignalType := {to_enum_value("CASE WHEN s ->>'SignalType' = '' THEN 'Empty' ELSE s->>'SignalType' END")}
+                )
+            ) AS Signals,
+            filename,
+            rn
+        FROM tmp_fsssignaldiscovered_raw
+    """, [("Signals[].SignalType", "FSS_SIGNAL_TYPE")], f"""
+        INSERT OR REPLACE INTO fsssignaldiscovered_latest (
+            timestamp, StarSystem, SystemAddress, Signals
+        )
+        SELECT
+            DISTINCT ON (SystemAddress) timestamp, StarSystem, SystemAddress, Signals
+        FROM tmp_extracted
+        ORDER BY timestamp DESC
+    """, batch_size)
 
 
-def import_systemspopulated(conn, imported):
+def import_systemspopulated(conn, imported, batch_size=None, dedup_window=DEDUP_WINDOW_SECONDS):
     fname = "systemsPopulated.json.gz"
     fpath = os.path.join(DIR_DATA_DUMP, fname)
     if not os.path.exists(fpath):
@@ -657,37 +981,76 @@ def import_systemspopulated(conn, imported):
     update_imported_file(conn, fname, 0, os.path.getsize(fpath))
 
 
-def main():
-    conn = connect_db()
-    create_schema(conn)
-    
-    imported = get_imported_files(conn)
-
+# Each entry imports one family of event files into its own tables, so they can run side by side.
+IMPORTERS = [
     # systems dump from EDSM
-    import_systemspopulated(conn, imported)
+    import_systemspopulated,
 
     # mix of permanent info (like stations) and transient info (like powerplay)
-    import_jump_jsonl_files(conn, imported)
-    import_approachsettlement_jsonl_files(conn, imported)
-    import_docked_jsonl_files(conn, imported)
-    import_location_jsonl_files(conn, imported)
-    
+    import_jump_jsonl_files,
+    import_approachsettlement_jsonl_files,
+    import_docked_jsonl_files,
+    import_location_jsonl_files,
+
     # permanent info about hotspots, and biological/geological signals.
-    import_saasignalsfound_jsonl_files(conn, imported)
-    
+    import_saasignalsfound_jsonl_files,
+
     # transient info (only keep latest info per entry)
-    import_commodity_jsonl_files(conn, imported)
+    import_commodity_jsonl_files,
     # transient info about signals in fss (also contains permanent info e.g. stations, but nothing useful)
     # this'd be mostly useful for tracking CZs, HazRes and PCZs.
-    import_fsssignaldiscovered_jsonl_files(conn, imported)
+    import_fsssignaldiscovered_jsonl_files,
 
     # this is all permanent info about bodies and number of biological/geo signals, but we don't need it.
-    # import_fssbodysignals_jsonl_files(conn, imported)
+    # import_fssbodysignals_jsonl_files,
+]
+
+
+def main(workers=len(IMPORTERS), threads=None, batch_size=None, dedup_window=DEDUP_WINDOW_SECONDS):
+    """
+    Import all pending files.
+
+    Args:
+        workers: number of event families imported at the same time, each on its own
+            cursor (1 runs them one after another on the main connection)
+        threads: DuckDB thread budget shared by all workers (default: DuckDB's own default)
+        batch_size: max number of files of one event type read in a single scan (default: all)
+        dedup_window: seconds within which identical jump/location/docked messages are
+            treated as duplicates, see drop_duplicate_rows()
+    """
+    conn = connect_db()
+    create_schema(conn)
+    if threads:
+        conn.execute(f"SET threads = {int(threads)}")
+
+    imported = get_imported_files(conn)
+
+    if workers <= 1:
+        for importer in IMPORTERS:
+            importer(conn, imported, batch_size, dedup_window)
+    else:
+        def run_importer(importer):
+            # cursors are separate connections to the same database, with their own temp tables
+            cursor = conn.cursor()
+            try:
+                importer(cursor, imported, batch_size, dedup_window)
+            finally:
+                cursor.close()
+            return importer.__name__
+
+        with ThreadPool(workers) as pool:
+            for i, name in enumerate(pool.imap_unordered(run_importer, IMPORTERS)):
+                print(f"Done: {name} ({i+1}/{len(IMPORTERS)})")
 
     conn.execute("CHECKPOINT;")
     conn.close()
 
 
 if __name__ == "__main__":
-    main()
-
+    parser = argparse.ArgumentParser(description="Import downloaded EDDN files into the main database.")
+    parser.add_argument('--workers', '-w', type=int, default=len(IMPORTERS), help=f'Event families imported concurrently (default: {len(IMPORTERS)})')
+    parser.add_argument('--threads', '-t', type=int, default=None, help='DuckDB thread budget (default: DuckDB default)')
+    parser.add_argument('--batch-size', '-b', type=int, default=None, help='Max files of one event type per scan (default: all pending files)')
+    parser.add_argument('--dedup-window', type=int, default=DEDUP_WINDOW_SECONDS, help=f'Seconds within which identical messages are duplicates (default: {DEDUP_WINDOW_SECONDS})')
+    args = parser.parse_args()
+    main(workers=args.workers, threads=args.threads, batch_size=args.batch_size, dedup_window=args.dedup_window)
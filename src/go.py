@@ -1,15 +1,29 @@
+import argparse
 import datetime as dt
+import glob
+import hashlib
+import json
 import os
+import queue
 import re
+import time
+from multiprocessing.pool import ThreadPool
 
-from constants import DB_MAIN_PATH, DIR_DATA_DUMP
+import duckdb
+
+from constants import DB_MAIN_PATH, DB_SITE_NAME, DIR_DATA_DUMP, DIR_TRACES, SITE_DIR
+import db
 import dl_hist
 import dl_today
 import extract
-import compress
+import ledger
 import report
+import sql_profile
 import transform
-import clean
+import tracing
+
+# Input fingerprints of the last successful run of each stage.
+PIPELINE_STATE_PATH = "pipeline_state.json"
 
 def get_auto_lookback_days(data_dump_dir, today_date):
     pattern = re.compile(r'Journal\.FSDJump-(\d{4}-\d{2}-\d{2})\.jsonl\.bz2\.lastmodified$')
@@ -24,33 +38,175 @@ def get_auto_lookback_days(data_dump_dir, today_date):
                     latest_fsd_date = file_date
             except ValueError:
                 continue  # Skip files with invalid dates
-                    
+
 
     if latest_fsd_date is None:
         print("No Journal.FSDJump files found, using default 1-day lookback")
         return 1
-    
+
     # Calculate days between today and the latest FSD file
     lookback_days = (today_date - latest_fsd_date).days
-    
+
     # Ensure reasonable bounds
     if lookback_days < 1:
         lookback_days = 1  # At least look back 1 day
     elif lookback_days > 30:
         lookback_days = 30  # Don't go back more than 30 days
-    
+
     print(f"Latest Journal.FSDJump file found: {latest_fsd_date}. Calculated lookback days: {lookback_days}")
-    
+
     return lookback_days
 
+
+def pipeline_stages(today):
+    """
+    The stages of a run as (name, run, depends_on, inputs, outputs).
+
+    inputs are file glob patterns, files (the code of the stage, so a change to it reruns the
+    stage) and tables in data.duckdb, see input_summary(). A stage whose inputs are the same as
+    on its last successful run, and whose outputs are all there, is skipped. Stages without
+    inputs (the downloads, which can only tell what is new by asking the server) always run.
+    Tables a stage reads must be written by the stages it depends on, as data.duckdb cannot be
+    read for the fingerprint while another stage has it open.
+    """
+    report_inputs = sorted({name for _, _, inputs in report.REPORT_TABLES for name in inputs} - {table for table, _, _ in report.REPORT_TABLES})
+    return [
+        ("dl_today", lambda: dl_today.main(today), [], None, []),
+        ("dl_hist", lambda: dl_hist.main(today, lookback_days=get_auto_lookback_days(DIR_DATA_DUMP, today)), [], None, []),
+        # the importers of the separate event types run concurrently within extract, see extract.main
+        ("extract", extract.main, ["dl_today", "dl_hist"],
+            [DIR_DATA_DUMP + "*.jsonl", DIR_DATA_DUMP + "*.gz", extract.__file__, db.__file__], [DB_MAIN_PATH]),
+        ("transform", transform.main, ["extract"],
+            ["jumps", "location", "docked", "approach_settlement", transform.__file__], [DB_MAIN_PATH]),
+        ("report", lambda: report.make_report_db(dt.datetime.now(dt.timezone.utc)), ["transform"],
+            report_inputs + [report.__file__], [os.path.join(SITE_DIR, DB_SITE_NAME + "_manifest.json")]),
+        # ("clean", lambda: clean.clean_data_dump(DIR_DATA_DUMP), ["extract"], None, []),
+    ]
+
+
+def input_summary(conn, name):
+    """Like report.input_summary, but also for glob patterns: the names, sizes and mtimes of the matching files."""
+    if glob.has_magic(name):
+        return ";".join(
+            f"{os.path.basename(path)}:{os.path.getsize(path)}:{os.stat(path).st_mtime_ns}"
+            for path in sorted(glob.glob(name))
+        )
+    try:
+        return report.input_summary(conn, name)
+    except duckdb.Error:
+        # not created yet
+        return "missing"
+
+
+def stage_fingerprint(inputs):
+    """Hash of the current state of the inputs of a stage, or None if it has none and always runs."""
+    if inputs is None:
+        return None
+    with duckdb.connect() as conn:
+        if os.path.exists(DB_MAIN_PATH):
+            conn.execute(f"ATTACH '{DB_MAIN_PATH}' AS db (READ_ONLY);")
+        parts = [f"{name}={input_summary(conn, name)}" for name in inputs]
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+
+def read_state():
+    try:
+        with open(PIPELINE_STATE_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_state(state):
+    tmp_path = PIPELINE_STATE_PATH + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, PIPELINE_STATE_PATH)
+
+
+def run_stage(name, run):
+    start = time.time()
+    try:
+        with tracing.span("stage", stage=name):
+            run()
+        return name, None, time.time() - start
+    except Exception as e:
+        return name, e, time.time() - start
+
+
+def run_pipeline(stages, workers=2, force=False):
+    """
+    Run the stages, each as soon as the stages it depends on are done, up to workers at a time.
+
+    A failed stage fails the stages that depend on it; the others still run. Raises at the end
+    if any stage failed.
+    """
+    state = read_state()
+    pending = {stage[0]: stage for stage in stages}
+    done, failed = set(), {}
+    finished = queue.Queue()
+    running = 0
+
+    with ThreadPool(workers) as pool:
+        while pending or running:
+            started = True
+            while started:
+                started = False
+                for name, run, depends_on, inputs, outputs in list(pending.values()):
+                    if any(dep in failed for dep in depends_on):
+                        del pending[name]
+                        failed[name] = None
+                        print(f"=== {name}: not run, {', '.join(dep for dep in depends_on if dep in failed)} failed.")
+                        started = True
+                        continue
+                    if not all(dep in done for dep in depends_on):
+                        continue
+                    del pending[name]
+                    started = True
+                    fingerprint = stage_fingerprint(inputs)
+                    if not force and fingerprint is not None and state.get(name) == fingerprint \
+                            and all(os.path.exists(path) for path in outputs):
+                        print(f"=== {name}: inputs unchanged, skipping.")
+                        done.add(name)
+                        continue
+                    print(f"=== {name}: starting.")
+                    pool.apply_async(run_stage, (name, run), callback=lambda result, fingerprint=fingerprint: finished.put((*result, fingerprint)))
+                    running += 1
+
+            if not running:
+                break
+            name, error, elapsed, fingerprint = finished.get()
+            running -= 1
+            if error is not None:
+                print(f"=== {name}: failed after {elapsed:.1f}s: {error!r}")
+                failed[name] = error
+                continue
+            print(f"=== {name}: done in {elapsed:.1f}s.")
+            done.add(name)
+            if fingerprint is not None:
+                state[name] = fingerprint
+                write_state(state)
+
+    errors = {name: error for name, error in failed.items() if error is not None}
+    if errors:
+        raise RuntimeError(f"Pipeline stages failed: {', '.join(errors)}") from next(iter(errors.values()))
+
+
 if __name__ == "__main__":
-    today = dl_today.main()
-    auto_lookback_days = get_auto_lookback_days(DIR_DATA_DUMP, today)
-    dl_hist.main(today, lookback_days=auto_lookback_days)
-    extract.main()
-    transform.main()
-    # this takes a long time and doesn't do much anymore as we now do incremental updates.
-    # compress.compress_database(DB_MAIN_PATH)
-    generated_at = dt.datetime.now(dt.timezone.utc)
-    report.make_report_db(generated_at)
-    # clean.clean_data_dump(DIR_DATA_DUMP)
+    parser = argparse.ArgumentParser(description="Download, import and report, skipping the stages whose inputs did not change.")
+    parser.add_argument('--force', action='store_true', help='Run every stage, even if its inputs did not change')
+    parser.add_argument('--workers', '-w', type=int, default=2, help='Stages run at the same time (default: 2)')
+    parser.add_argument('--profile-sql', action='store_true', help='Save DuckDB profiles of the heavy statements, see sql_profile.py')
+    args = parser.parse_args()
+
+    started_at = dt.datetime.now(dt.timezone.utc)
+    run_id = started_at.strftime("%Y%m%dT%H%M%SZ")
+    if args.profile_sql:
+        sql_profile.start(run_id)
+    rows_before = ledger.table_row_counts()
+    try:
+        today = dl_today.get_today_from_website()
+        run_pipeline(pipeline_stages(today), workers=args.workers, force=args.force)
+    finally:
+        spans = tracing.write_run(DIR_TRACES, run_id)
+        ledger.record_run(run_id, started_at, spans, rows_before)
@@ -0,0 +1,99 @@
+"""
+Shared HTTP client for the downloaders.
+
+dl_today and dl_hist fetch dozens of files per run from the same hosts. Going through one pooled
+keep-alive session means a TLS handshake per host and thread instead of per file. Every request is
+timed from sending it to the last byte of its body, see print_summary.
+"""
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Enough connections per host for the download thread pools.
+POOL_SIZE = 16
+CHUNK_SIZE = 64 * 1024
+
+_session = None
+_session_lock = threading.Lock()
+
+# One dict per finished request: label, url, status, bytes, seconds (until the last body byte)
+# and ttfb (until the response headers).
+timings = []
+_timings_lock = threading.Lock()
+
+
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def get(url, headers=None, timeout=120, label=None):
+    """Streamed GET through the shared session. Hand the response to stream_to_file or finish.
+
+    label groups the request with the others of the same downloader for print_summary.
+    """
+    start = time.perf_counter()
+    response = get_session().get(url, headers=headers, stream=True, timeout=timeout)
+    response.started_at = start
+    response.label = label
+    return response
+
+
+def head(url, headers=None, timeout=30, label=None):
+    """HEAD through the shared session, recorded like a GET without a body."""
+    start = time.perf_counter()
+    response = get_session().head(url, headers=headers, timeout=timeout)
+    response.started_at = start
+    response.label = label
+    finish(response)
+    return response
+
+
+def finish(response, body_bytes=0):
+    """Record the timing of a response and release its connection back to the pool."""
+    response.close()
+    with _timings_lock:
+        timings.append({
+            "label": response.label,
+            "url": response.url,
+            "status": response.status_code,
+            "bytes": body_bytes,
+            "seconds": time.perf_counter() - response.started_at,
+            "ttfb": response.elapsed.total_seconds(),
+        })
+
+
+def stream_to_file(response, path, mode="wb"):
+    """Write the body of a response to path (mode "ab" to append) and return the number of bytes."""
+    body_bytes = 0
+    with open(path, mode) as f:
+        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+            f.write(chunk)
+            body_bytes += len(chunk)
+    finish(response, body_bytes)
+    return body_bytes
+
+
+def print_summary(label):
+    """Print and reset the timings recorded so far for requests with this label. Returns their total bytes."""
+    with _timings_lock:
+        done = [t for t in timings if t["label"] == label]
+        timings[:] = [t for t in timings if t["label"] != label]
+    if not done:
+        return 0
+    total_bytes = sum(t["bytes"] for t in done)
+    total_seconds = sum(t["seconds"] for t in done)
+    slowest = max(done, key=lambda t: t["seconds"])
+    print(f"{label}: {len(done)} requests, {total_bytes / 1e6:.1f} MB in {total_seconds:.1f}s of request time, "
+          f"mean time to first byte {sum(t['ttfb'] for t in done) / len(done) * 1000:.0f} ms, "
+          f"slowest {slowest['seconds']:.1f}s ({slowest['url']})")
+    return total_bytes
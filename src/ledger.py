@@ -0,0 +1,139 @@
+"""
+Ledger of go.py runs in the pipeline_runs table of data.duckdb, and a check for regressions.
+
+go.py records every run: how long each stage that ran took, which stages failed, the number of
+files in data-dump, how many rows each table gained, and the size of data.duckdb and of the
+site database. Running this module compares the latest run with the median of the runs before it:
+
+    python ledger.py [--baseline-runs 10] [--slowdown 1.5] [--min-seconds 30] [--site-budget-mb 50]
+
+It exits with status 1 when a stage failed or got slower, or the site database is over budget.
+"""
+import argparse
+import datetime as dt
+import os
+import statistics
+import sys
+
+import duckdb
+
+from constants import DB_MAIN_PATH, DIR_DATA_DUMP, SITE_DIR
+from db import connect_db, create_pipeline_runs_table
+import report
+
+# Site database size above which browsers start to struggle.
+SITE_DB_BUDGET_MB = 50
+
+
+def table_row_counts():
+    """Rows of every table in data.duckdb, or {} if there is no database yet."""
+    if not os.path.exists(DB_MAIN_PATH):
+        return {}
+    with duckdb.connect(DB_MAIN_PATH, read_only=True) as conn:
+        tables = [row[0] for row in conn.execute(
+            "SELECT table_name FROM duckdb_tables() WHERE database_name = current_database() AND NOT temporary"
+        ).fetchall()]
+        return {table: conn.execute(f'SELECT count(*) FROM "{table}"').fetchone()[0] for table in tables}
+
+
+def site_db_bytes():
+    """Size of the table files the current site manifest points to."""
+    tables = report.read_manifest().get("tables", {})
+    return sum(
+        os.path.getsize(os.path.join(SITE_DIR, info["file"]))
+        for info in tables.values()
+        if os.path.exists(os.path.join(SITE_DIR, info["file"]))
+    )
+
+
+def record_run(run_id, started_at, spans, rows_before):
+    """Add a run to pipeline_runs, from its stage spans (see tracing) and the row counts before it.
+
+    started_at is an aware UTC datetime.
+    """
+    stage_spans = [s for s in spans if s["name"] == "stage"]
+    stage_seconds = {s["labels"]["stage"]: s["seconds"] for s in stage_spans}
+    failed_stages = [s["labels"]["stage"] for s in stage_spans if "error" in s]
+    rows_after = table_row_counts()
+    rows_added = {table: rows - rows_before.get(table, 0) for table, rows in rows_after.items() if table != "pipeline_runs"}
+    data_dump_files = len(os.listdir(DIR_DATA_DUMP)) if os.path.isdir(DIR_DATA_DUMP) else 0
+
+    conn = connect_db()
+    try:
+        create_pipeline_runs_table(conn)
+        conn.execute("""
+            INSERT OR REPLACE INTO pipeline_runs
+            VALUES (?, ?, ?, ?, MAP(?::VARCHAR[], ?::DOUBLE[]), ?, MAP(?::VARCHAR[], ?::BIGINT[]), ?, ?)
+        """, [
+            run_id, started_at.replace(tzinfo=None), dt.datetime.now(dt.timezone.utc).replace(tzinfo=None), failed_stages,
+            list(stage_seconds), list(stage_seconds.values()),
+            data_dump_files,
+            list(rows_added), list(rows_added.values()),
+            os.path.getsize(DB_MAIN_PATH), site_db_bytes(),
+        ])
+        conn.execute("CHECKPOINT;")
+    finally:
+        conn.close()
+    print(f"Recorded run {run_id} in pipeline_runs.")
+
+
+def check_regressions(baseline_runs=10, slowdown=1.5, min_seconds=30, site_budget_mb=SITE_DB_BUDGET_MB):
+    """
+    Compare the latest run with the median of the baseline_runs before it. Returns the problems found.
+
+    A stage counts as slower if it took more than slowdown times its median and at least
+    min_seconds longer, so the short stages do not trip on noise.
+    """
+    if not os.path.exists(DB_MAIN_PATH):
+        print(f"No {DB_MAIN_PATH} yet, nothing to check.")
+        return []
+    with duckdb.connect(DB_MAIN_PATH, read_only=True) as conn:
+        if not conn.execute("SELECT count(*) FROM duckdb_tables() WHERE table_name = 'pipeline_runs'").fetchone()[0]:
+            print("No runs recorded yet, nothing to check.")
+            return []
+        runs = conn.execute("""
+            SELECT run_id, failed_stages, map_keys(stage_seconds), map_values(stage_seconds), site_db_bytes, db_bytes
+            FROM pipeline_runs
+            ORDER BY started_at DESC
+            LIMIT ?
+        """, [baseline_runs + 1]).fetchall()
+    if not runs:
+        print("No runs recorded yet, nothing to check.")
+        return []
+
+    latest_id, failed_stages, stages, seconds, site_bytes, db_bytes = runs[0]
+    baseline = [dict(zip(run[2], run[3])) for run in runs[1:]]
+    print(f"Run {latest_id}, compared with the {len(baseline)} runs before it:")
+
+    problems = [f"stage {stage} failed" for stage in failed_stages]
+    for stage, took in zip(stages, seconds):
+        previous = [run[stage] for run in baseline if stage in run]
+        if not previous:
+            print(f"  {stage}: {took:.1f}s (no baseline)")
+            continue
+        median = statistics.median(previous)
+        print(f"  {stage}: {took:.1f}s (median {median:.1f}s over {len(previous)} runs)")
+        if took > median * slowdown and took - median >= min_seconds:
+            problems.append(f"stage {stage} took {took:.1f}s, {took / max(median, 1e-9):.1f}x its median of {median:.1f}s")
+
+    print(f"  site database: {site_bytes / 1e6:.1f} MB (budget {site_budget_mb} MB), data.duckdb: {db_bytes / 1e6:.1f} MB")
+    if site_bytes > site_budget_mb * 1e6:
+        problems.append(f"site database is {site_bytes / 1e6:.1f} MB, over the {site_budget_mb} MB budget")
+    return problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the latest go.py run for regressions against the runs before it.")
+    parser.add_argument('--baseline-runs', type=int, default=10, help='Number of earlier runs the median is taken over (default: 10)')
+    parser.add_argument('--slowdown', type=float, default=1.5, help='Factor over its median that makes a stage slower (default: 1.5)')
+    parser.add_argument('--min-seconds', type=float, default=30, help='Seconds a stage must be slower than its median at least (default: 30)')
+    parser.add_argument('--site-budget-mb', type=float, default=SITE_DB_BUDGET_MB, help=f'Site database budget in MB (default: {SITE_DB_BUDGET_MB})')
+    args = parser.parse_args()
+
+    problems = check_regressions(args.baseline_runs, args.slowdown, args.min_seconds, args.site_budget_mb)
+    if problems:
+        print("REGRESSION:")
+        for problem in problems:
+            print(f"  - {problem}")
+        sys.exit(1)
+    print("No regressions.")
@@ -1,21 +1,117 @@
-from http.server import HTTPServer
+from http.server import ThreadingHTTPServer
 from RangeHTTPServer import RangeRequestHandler
 import argparse
+import email.utils
+import gzip
+import os
+import uuid
 from functools import partial
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Text assets that get .br/.gz siblings and are served compressed when the client accepts it.
+# .duckdb files are never compressed: DuckDB-WASM reads them with range requests.
+COMPRESSIBLE_EXTENSIONS = ('.html', '.js', '.mjs', '.css', '.json', '.svg', '.csv', '.txt')
+
+# Preferred first.
+ENCODINGS = [("br", ".br"), ("gzip", ".gz")]
+
+
+def precompress_assets(directory):
+    """Write .gz (and .br, if brotli is installed) siblings next to every text asset under directory.
+
+    Siblings that are newer than their source are left alone, so this is cheap to run before every serve.
+    """
+    written = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if not name.endswith(COMPRESSIBLE_EXTENSIONS):
+                continue
+            path = os.path.join(root, name)
+            with open(path, 'rb') as f:
+                data = None
+                for encoding, suffix in ENCODINGS:
+                    if encoding == "br" and brotli is None:
+                        continue
+                    target = path + suffix
+                    if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(path):
+                        continue
+                    if data is None:
+                        data = f.read()
+                    if encoding == "br":
+                        compressed = brotli.compress(data, quality=11)
+                    else:
+                        # mtime=0 so the output, and with it the ETag, only depends on the content
+                        compressed = gzip.compress(data, compresslevel=9, mtime=0)
+                    with open(target, 'wb') as out:
+                        out.write(compressed)
+                    written += 1
+    if brotli is None:
+        print("brotli is not installed, only wrote .gz files.")
+    print(f"Precompressed {written} files under {directory}.")
+
+
+def parse_byte_ranges(header, file_len):
+    """Inclusive (first, last) pairs of a Range header, clipped to the file.
+
+    Unsatisfiable ranges are left out, so an empty list means 416. Raises ValueError if malformed.
+    """
+    unit, _, spec = header.partition('=')
+    if unit.strip() != 'bytes':
+        raise ValueError(f'Invalid byte range {header}')
+    ranges = []
+    for part in spec.split(','):
+        first, sep, last = part.strip().partition('-')
+        if not sep:
+            raise ValueError(f'Invalid byte range {header}')
+        if first == '':
+            # suffix range: the last n bytes
+            length = int(last)
+            if length == 0:
+                continue
+            first, last = max(file_len - length, 0), file_len - 1
+        else:
+            first = int(first)
+            last = int(last) if last else None
+            if last is not None and last < first:
+                raise ValueError(f'Invalid byte range {header}')
+            if first >= file_len:
+                continue
+            last = file_len - 1 if last is None else min(last, file_len - 1)
+        ranges.append((first, last))
+    return ranges
+
+
 class CORSRangeRequestHandler(RangeRequestHandler):
+    # Keep connections open between requests; every response carries a Content-Length.
+    protocol_version = 'HTTP/1.1'
+
+    # When set, text assets are served from their precompressed siblings with ETags instead of
+    # with caching disabled, like the production host does.
+    negotiate = False
+
     def end_headers(self):
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Range, Content-Type, Authorization')
-        # Disable caching for development
-        self.send_header('Cache-Control', 'no-store, no-cache, must-revalidate, max-age=0')
-        self.send_header('Pragma', 'no-cache')
-        self.send_header('Expires', '0')
+        if not self.negotiate:
+            # Disable caching for development
+            self.send_header('Cache-Control', 'no-store, no-cache, must-revalidate, max-age=0')
+            self.send_header('Pragma', 'no-cache')
+            self.send_header('Expires', '0')
         super().end_headers()
 
+    def send_header(self, keyword, value):
+        if keyword.lower() == 'content-length':
+            self.content_length = int(value)
+        super().send_header(keyword, value)
+
     def do_OPTIONS(self):
         self.send_response(200, "ok")
+        self.send_header('Content-Length', '0')
         self.end_headers()
 
     def guess_type(self, path):
@@ -23,16 +119,152 @@ class CORSRangeRequestHandler(RangeRequestHandler):
             return "application/octet-stream"
         return super().guess_type(path)
 
+    def send_head(self):
+        self.ranges = None
+        self.content_length = None
+        if 'Range' in self.headers:
+            return self.send_range_head()
+        if not self.negotiate:
+            return super().send_head()
+        path = self.translate_path(self.path)
+        if os.path.isdir(path) and self.path.split('?', 1)[0].endswith('/'):
+            path = os.path.join(path, 'index.html')
+        if not path.endswith(COMPRESSIBLE_EXTENSIONS) or not os.path.isfile(path):
+            return super().send_head()
+        return self.send_negotiated_head(path)
+
+    def accepted_encodings(self):
+        accepted = set()
+        for part in self.headers.get('Accept-Encoding', '').split(','):
+            coding, _, params = part.strip().partition(';')
+            q = params.strip().removeprefix('q=')
+            try:
+                if params and float(q) == 0:
+                    continue
+            except ValueError:
+                pass
+            accepted.add(coding.strip().lower())
+        return accepted
+
+    def send_negotiated_head(self, path):
+        """Headers for a text asset: pick a precompressed variant, and answer 304 if the client has it."""
+        accepted = self.accepted_encodings()
+        served_path, content_encoding = path, None
+        for encoding, suffix in ENCODINGS:
+            variant = path + suffix
+            if (encoding in accepted or '*' in accepted) and os.path.isfile(variant) \
+                    and os.path.getmtime(variant) >= os.path.getmtime(path):
+                served_path, content_encoding = variant, encoding
+                break
+
+        f = open(served_path, 'rb')
+        fs = os.fstat(f.fileno())
+        # Strong ETag, distinct per encoding as the bytes differ
+        etag = f'"{fs.st_size:x}-{fs.st_mtime_ns:x}{"-" + content_encoding if content_encoding else ""}"'
+
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match and (if_none_match.strip() == '*' or etag in [t.strip() for t in if_none_match.split(',')]):
+            f.close()
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Vary', 'Accept-Encoding')
+            self.send_header('Cache-Control', 'no-cache')
+            self.end_headers()
+            return None
+
+        self.send_response(200)
+        self.send_header('Content-type', self.guess_type(path))
+        if content_encoding:
+            self.send_header('Content-Encoding', content_encoding)
+        self.send_header('Content-Length', str(fs.st_size))
+        self.send_header('Last-Modified', email.utils.formatdate(fs.st_mtime, usegmt=True))
+        self.send_header('ETag', etag)
+        self.send_header('Vary', 'Accept-Encoding')
+        # Always revalidate, which is a cheap 304 while the file is unchanged
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        return f
+
+    def send_range_head(self):
+        """Headers for a 206 response to one or more byte ranges; multiple ranges become multipart/byteranges."""
+        path = self.translate_path(self.path)
+        try:
+            f = open(path, 'rb')
+        except OSError:
+            self.send_error(404, 'File not found')
+            return None
+        fs = os.fstat(f.fileno())
+        try:
+            ranges = parse_byte_ranges(self.headers['Range'], fs.st_size)
+        except ValueError:
+            f.close()
+            self.send_error(400, 'Invalid byte range')
+            return None
+        if not ranges:
+            f.close()
+            # with the current size, so clients can tell "no new data" from "file got shorter"
+            self.send_response(416)
+            self.send_header('Content-Range', f'bytes */{fs.st_size}')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return None
+
+        ctype = self.guess_type(path)
+        self.send_response(206)
+        if len(ranges) == 1:
+            first, last = ranges[0]
+            self.send_header('Content-type', ctype)
+            self.send_header('Content-Range', f'bytes {first}-{last}/{fs.st_size}')
+            self.send_header('Content-Length', str(last - first + 1))
+        else:
+            boundary = uuid.uuid4().hex
+            self.part_headers = [
+                f'\r\n--{boundary}\r\nContent-Type: {ctype}\r\nContent-Range: bytes {first}-{last}/{fs.st_size}\r\n\r\n'.encode()
+                for first, last in ranges]
+            self.closing_boundary = f'\r\n--{boundary}--\r\n'.encode()
+            length = sum(len(h) for h in self.part_headers) + sum(last - first + 1 for first, last in ranges) \
+                + len(self.closing_boundary)
+            self.send_header('Content-type', f'multipart/byteranges; boundary={boundary}')
+            self.send_header('Content-Length', str(length))
+        self.send_header('Last-Modified', self.date_time_string(fs.st_mtime))
+        self.end_headers()
+        self.ranges = ranges
+        return f
+
+    def copyfile(self, source, outputfile):
+        # socket.sendfile uses os.sendfile where the platform has it, so file bodies are not copied
+        # through Python buffers, and falls back to plain sends for in-memory listings and on Windows.
+        if not self.ranges:
+            # never past the announced length: a file that grows meanwhile would corrupt the next
+            # response on this kept-alive connection
+            self.connection.sendfile(source, count=self.content_length)
+        elif len(self.ranges) == 1:
+            first, last = self.ranges[0]
+            self.connection.sendfile(source, first, last - first + 1)
+        else:
+            for part_header, (first, last) in zip(self.part_headers, self.ranges):
+                outputfile.write(part_header)
+                self.connection.sendfile(source, first, last - first + 1)
+            outputfile.write(self.closing_boundary)
+
 def main():
     parser = argparse.ArgumentParser(description="Start a RangeHTTPServer with CORS enabled.")
     parser.add_argument('--bind', '-b', default='0.0.0.0', help='Bind address (default: 0.0.0.0)')
     parser.add_argument('--port', '-p', type=int, default=8000, help='Port (default: 8000)')
     parser.add_argument('--directory', '-d', default='.', help='Directory to serve (default: current directory)')
+    parser.add_argument('--precompress', action='store_true', help='Write .br/.gz siblings of the text assets before serving')
+    parser.add_argument('--negotiate', action='store_true',
+                        help='Serve precompressed text assets by Accept-Encoding, with ETags and 304s, instead of disabling caching')
     args = parser.parse_args()
 
+    if args.precompress:
+        precompress_assets(args.directory)
+
     handler_class = partial(CORSRangeRequestHandler, directory=args.directory)
+    CORSRangeRequestHandler.negotiate = args.negotiate
 
-    server = HTTPServer((args.bind, args.port), handler_class)
+    # A thread per connection, so DuckDB-WASM's parallel range requests are served side by side
+    server = ThreadingHTTPServer((args.bind, args.port), handler_class)
     print(f"Serving HTTP with Range and CORS on {args.bind}:{args.port}, directory: {args.directory}")
     try:
         server.serve_forever()
@@ -41,4 +273,4 @@ def main():
         server.server_close()
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
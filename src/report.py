@@ -2,27 +2,57 @@ import duckdb
 import datetime as dt
 import os
 import json
+import hashlib
+import inspect
+import tempfile
 
 from constants import SITE_DIR, DB_SITE_NAME
 import glob
-import compress
+import sql_profile
+import tracing
 
 
+# Edge of the grid cells used to find the systems in support range, in ly. Must be at least
+# the largest support range (30 ly for strongholds).
+SUPPORT_GRID_CELL_LY = 30
 
-def make_report_db(generated_at = dt.datetime.now()):
-    pattern = os.path.join(SITE_DIR, f"{DB_SITE_NAME}*.duckdb")
-    for path in glob.glob(pattern):
-        try:
-            os.remove(path)
-            print(f"Removed existing report database: {path}")
-        except OSError:
-            print(f"Could not remove {path}, skipping.")
+# The site reads the database over HTTP range requests, and every row group a query can't prune
+# with its zone maps costs round trips. Tables are sorted on the columns the site filters on and
+# written in small row groups, so a point lookup touches one or two of them.
+SITE_ROW_GROUP_SIZE = 8192
 
-    db_site_path = os.path.join(SITE_DIR, f"{DB_SITE_NAME}_{generated_at.strftime('%Y%m%d_%H%M%S')}.duckdb")
+# The lookups in site/utils/data-access.js and friends, with the table they read and a query picking
+# a typical parameter, used to check how many blocks they read from the written file.
+CANONICAL_QUERIES = {
+    "system_by_address": (
+        "systems",
+        "SELECT * FROM systems WHERE SystemAddress = ?",
+        "SELECT quantile_disc(SystemAddress, 0.5) FROM systems"),
+    "system_name_prefix": (
+        "system_names",
+        "SELECT StarSystem, SystemAddress FROM system_names WHERE NameKey >= $1 AND NameKey < $1 || chr(65535) ORDER BY NameKey LIMIT 20",
+        "SELECT left(quantile_disc(NameKey, 0.5), 5) FROM system_names"),
+    "supporting_systems": (
+        "powerplay_support",
+        "SELECT SupportingSystemAddress, Distance FROM powerplay_support WHERE SupportedSystemAddress = ?",
+        "SELECT quantile_disc(SupportedSystemAddress, 0.5) FROM powerplay_support"),
+    "supported_systems": (
+        "powerplay_support",
+        "SELECT SupportedSystemAddress, Distance FROM powerplay_support WHERE SupportingSystemAddress = ?",
+        "SELECT quantile_disc(SupportingSystemAddress, 0.5) FROM powerplay_support"),
+    "settlements_by_system": (
+        "settlements",
+        "SELECT * FROM settlements WHERE SystemAddress = ?",
+        "SELECT quantile_disc(SystemAddress, 0.5) FROM settlements"),
+    "enclave_cycle": (
+        "enclave_activity",
+        "SELECT * FROM enclave_activity WHERE timestamp >= ?",
+        "SELECT max(timestamp) - INTERVAL 7 DAY FROM enclave_activity"),
+}
 
-    print(f"Creating report database at {db_site_path} ...", end="")
-    conn = duckdb.connect(db_site_path)
-    conn.execute("ATTACH 'data.duckdb' as db (READ_ONLY);")
+
+def build_systems(conn):
+    """Populated systems with their latest powerplay state."""
     conn.execute("""
         CREATE OR REPLACE TABLE systems AS
             WITH 
@@ -72,9 +102,28 @@ def make_report_db(generated_at = dt.datetime.now()):
                 FROM populated
                 WHERE HasPowerplayData
             )
-            SELECT * FROM activities;
+            SELECT * FROM activities
+            ORDER BY SystemAddress;
     """)
+
+
+def build_system_names(conn):
+    """Lowercased system names in sorted order, so autocomplete is a range scan over a few row groups."""
     conn.execute("""
+        CREATE OR REPLACE TABLE system_names AS
+        SELECT lower(StarSystem) AS NameKey, StarSystem, SystemAddress
+        FROM systems
+        WHERE StarSystem IS NOT NULL
+        ORDER BY NameKey;
+    """)
+
+
+def build_powerplay_support(conn):
+    """Pairs of supporting (Fortified/Stronghold) and supported systems of the same power."""
+    # Systems are bucketed into cubes as large as the largest support range, so a supporting system
+    # only has to be compared with the systems in its own cell and the 26 cells around it.
+    cell = SUPPORT_GRID_CELL_LY
+    sql_profile.execute(conn, "report_powerplay_support", f"""
         CREATE OR REPLACE TABLE powerplay_support AS
         WITH
         populated AS (
@@ -95,6 +144,25 @@ def make_report_db(generated_at = dt.datetime.now()):
             FROM populated
             WHERE Powers != []
             AND PowerplayState IN ('Exploited', 'Unoccupied')
+        ),
+        supporting_cells AS (
+            SELECT
+                SystemAddress, ControllingPower, StarPos, MaxDistance,
+                CAST(floor(StarPos[1] / {cell}) AS INTEGER) + dx AS CellX,
+                CAST(floor(StarPos[2] / {cell}) AS INTEGER) + dy AS CellY,
+                CAST(floor(StarPos[3] / {cell}) AS INTEGER) + dz AS CellZ
+            FROM supporting,
+                (SELECT unnest([-1, 0, 1]) AS dx),
+                (SELECT unnest([-1, 0, 1]) AS dy),
+                (SELECT unnest([-1, 0, 1]) AS dz)
+        ),
+        supported_cells AS (
+            SELECT
+                SystemAddress, Power, StarPos,
+                CAST(floor(StarPos[1] / {cell}) AS INTEGER) AS CellX,
+                CAST(floor(StarPos[2] / {cell}) AS INTEGER) AS CellY,
+                CAST(floor(StarPos[3] / {cell}) AS INTEGER) AS CellZ
+            FROM supported
         )
 
         SELECT
@@ -106,32 +174,23 @@ def make_report_db(generated_at = dt.datetime.now()):
                 POW(t2.StarPos[2] - t1.StarPos[2], 2) +
                 POW(t2.StarPos[3] - t1.StarPos[3], 2)
             ) AS Distance
-        FROM supporting AS t1
-        JOIN supported AS t2 
+        FROM supporting_cells AS t1
+        JOIN supported_cells AS t2 
             ON t1.ControllingPower = t2.Power
+            AND t1.CellX = t2.CellX
+            AND t1.CellY = t2.CellY
+            AND t1.CellZ = t2.CellZ
             AND SQRT(
                 POW(t2.StarPos[1] - t1.StarPos[1], 2) +
                 POW(t2.StarPos[2] - t1.StarPos[2], 2) +
                 POW(t2.StarPos[3] - t1.StarPos[3], 2)
             )  <= t1.MaxDistance
-        WHERE t2.Power = 'Li Yong-Rui'; -- keep only LYR for now.
-    """)
-    conn.execute("""
-    CREATE OR REPLACE MACRO system_distance(system1, system2) AS
-        (WITH 
-            __p1 AS (SELECT StarPos FROM systems WHERE StarSystem = system1 LIMIT 1),
-            __p2 AS (SELECT StarPos FROM systems WHERE StarSystem = system2 LIMIT 1)
-        SELECT array_distance(__p1.StarPos, __p2.StarPos)
-        FROM __p1, __p2);
-    """)
-    conn.execute("""
-    CREATE OR REPLACE MACRO system__address_distance(system1, system2) AS
-        (WITH 
-            __p1 AS (SELECT StarPos FROM systems WHERE SystemAddress = system1 LIMIT 1),
-            __p2 AS (SELECT StarPos FROM systems WHERE SystemAddress = system2 LIMIT 1)
-        SELECT array_distance(__p1.StarPos, __p2.StarPos)
-        FROM __p1, __p2);
+        ORDER BY SupportedSystemAddress, SupportingSystemAddress;
     """)
+
+
+def build_infra_failures(conn):
+    """Gold, silver and palladium markets of factions in InfrastructureFailure."""
     conn.execute("""
         CREATE OR REPLACE TABLE infra_failures AS
         WITH infra_failures AS (
@@ -191,12 +250,18 @@ def make_report_db(generated_at = dt.datetime.now()):
             wl.InfraFailTimestamp,
             wl.MarketTimestamp,
             s.ControllingPower,
-            s.PowerplayState
+            s.PowerplayState,
+            -- Carried along so the site can compute distances with a plain vector expression.
+            s.StarPos
         FROM wash_locations wl
         JOIN systems s ON s.SystemAddress = wl.SystemAddress
         ORDER BY InfraFailTimestamp DESC, MarketTimestamp DESC;
     """)
-    conn.execute("""
+
+
+def build_enclave_activity(conn):
+    """Powerplay progress over time for the systems in enclave.csv."""
+    sql_profile.execute(conn, "report_enclave_activity", """
     CREATE OR REPLACE TABLE enclave_activity AS
         WITH 
         enc as (SELECT Name FROM 'enclave.csv'),
@@ -269,8 +334,12 @@ def make_report_db(generated_at = dt.datetime.now()):
             PowerplayStateReinforcement AS reinforcement,
             PowerplayStateUndermining AS undermining
         FROM dedup
-        ORDER BY StarSystem, timestamp;
+        ORDER BY timestamp, StarSystem;
     """)
+
+
+def build_settlements(conn):
+    """Latest known odyssey settlements with their body names."""
     conn.execute("""
     CREATE OR REPLACE TABLE settlements AS
         WITH docked_settlements AS (
@@ -319,23 +388,215 @@ def make_report_db(generated_at = dt.datetime.now()):
             AND d.StationName = b.SettlementName
         ORDER BY d.SystemAddress, d.StationName;
     """)
+
+
+# Report tables in build order, with the inputs each one is built from: tables in data.duckdb,
+# report tables built earlier in the list, or files.
+REPORT_TABLES = [
+    ("systems", build_systems, ["systems_populated", "system_latest", "station_latest"]),
+    ("system_names", build_system_names, ["systems"]),
+    ("powerplay_support", build_powerplay_support, ["system_latest"]),
+    ("infra_failures", build_infra_failures, ["system_latest", "station_latest", "commodities_latest", "systems"]),
+    ("enclave_activity", build_enclave_activity, ["jumps", "location", "enclave.csv"]),
+    ("settlements", build_settlements, ["docked", "approach_settlement"]),
+]
+
+
+# Tables in data.duckdb that rows are only ever appended to. Any change to them changes their row
+# count or latest timestamp, which is much cheaper to look up than hashing their content.
+APPEND_ONLY_TABLES = {"jumps", "location", "docked", "approach_settlement", "saasignalsfound"}
+
+
+def input_summary(conn, name):
+    """Cheap summary of a table in data.duckdb or a file that changes whenever its content does."""
+    if os.path.isfile(name):
+        stat = os.stat(name)
+        return f"{stat.st_size}:{stat.st_mtime_ns}"
+    if name in APPEND_ONLY_TABLES:
+        row = conn.execute(f"SELECT count(*), max(timestamp) FROM db.{name}").fetchone()
+    else:
+        # the *_latest tables are upserted in place, and a replaced row can keep an older timestamp
+        row = conn.execute(f"SELECT count(*), sum(hash(*COLUMNS(*))) FROM db.{name}").fetchone()
+    return ":".join(str(v) for v in row)
+
+
+def code_names(code):
+    """Global names used by a code object and the lambdas and comprehensions inside it."""
+    yield from code.co_names
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            yield from code_names(const)
+
+
+def code_summary(func, seen):
+    """Source of func and of the functions of this module it calls, and the module constants they use."""
+    seen.add(func.__name__)
+    parts = [inspect.getsource(func)]
+    for name in code_names(func.__code__):
+        value = globals().get(name)
+        if name in seen:
+            continue
+        if inspect.isfunction(value) and value.__module__ == __name__:
+            parts.extend(code_summary(value, seen))
+        elif isinstance(value, (int, float, str, tuple, list, dict)):
+            seen.add(name)
+            parts.append(f"{name} = {value!r}")
+    return parts
+
+
+def table_fingerprint(conn, build, inputs, fingerprints, summaries):
+    """Hash of the code building a report table and the current state of everything it reads."""
+    parts = code_summary(build, set())
+    for name in inputs:
+        if name in fingerprints:
+            parts.append(fingerprints[name])
+        else:
+            if name not in summaries:
+                summaries[name] = input_summary(conn, name)
+            parts.append(summaries[name])
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+
+def read_manifest():
+    """The manifest of the previous generation, or an empty one."""
+    manifest_path = os.path.join(SITE_DIR, DB_SITE_NAME + "_manifest.json")
+    try:
+        with open(manifest_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def table_content_hash(conn, table):
+    """Hash of the columns and rows of a report table (regardless of row order), and its row count."""
+    columns = conn.execute("""
+        SELECT column_name, data_type FROM duckdb_columns()
+        WHERE database_name = 'memory' AND table_name = ?
+        ORDER BY column_index
+    """, [table]).fetchall()
+    rows, rows_hash = conn.execute(f"SELECT count(*), sum(hash(*COLUMNS(*))) FROM {table}").fetchone()
+    return hashlib.sha256(f"{columns}:{rows}:{rows_hash}".encode()).hexdigest()[:16], rows
+
+
+def write_table_file(conn, table, path):
+    """Write one report table to its own database file in a single pass."""
+    tmp_path = path + ".tmp"
+    conn.execute(f"ATTACH '{tmp_path}' AS site (ROW_GROUP_SIZE {SITE_ROW_GROUP_SIZE});")
+    conn.execute(f"CREATE TABLE site.{table} AS FROM memory.{table};")
+    conn.execute("DETACH site;")
+    # only ever show complete files under their final name, as that name is reused across generations
+    os.replace(tmp_path, path)
+
+
+def load_table_file(conn, table, path):
+    """Bring a report table kept from an earlier generation into memory, for the tables built from it."""
+    conn.execute(f"ATTACH '{path}' AS kept (READ_ONLY);")
+    conn.execute(f"CREATE TABLE {table} AS FROM kept.{table};")
+    conn.execute("DETACH kept;")
+
+
+def count_blocks_read(tables):
+    """Blocks each of CANONICAL_QUERIES reads from its table's file, starting from a cold cache."""
+    profile_path = os.path.join(tempfile.gettempdir(), "report_blocks_read.json")
+    blocks_read = {}
+    for name, (table, query, sample_query) in CANONICAL_QUERIES.items():
+        path = os.path.join(SITE_DIR, tables[table]["file"])
+        with duckdb.connect(path, read_only=True) as conn:
+            param = conn.execute(sample_query).fetchone()[0]
+            block_size = conn.execute("SELECT block_size FROM pragma_database_size()").fetchone()[0]
+        if param is None:
+            continue
+        # fresh connection so nothing is in the buffer pool yet
+        with duckdb.connect(path, read_only=True) as conn:
+            conn.execute("SET enable_profiling = 'json';")
+            conn.execute(f"SET profiling_output = '{profile_path}';")
+            conn.execute("SET custom_profiling_settings = '{\"TOTAL_BYTES_READ\": \"true\"}';")
+            conn.execute(query, [param]).fetchall()
+        with open(profile_path) as f:
+            bytes_read = json.load(f)["total_bytes_read"]
+        blocks_read[name] = -(-bytes_read // block_size)
+        print(f"  {name}: {blocks_read[name]} blocks read.")
+    if os.path.exists(profile_path):
+        os.remove(profile_path)
+    return blocks_read
+
+
+def make_report_db(generated_at = dt.datetime.now()):
+    """Write a new generation of the site data, one database file per table.
+
+    Tables whose inputs did not change since the previous generation keep their file. The others
+    are rebuilt in memory from data.duckdb and written under a name derived from their content, so
+    a table that comes out the same keeps its file, and the blocks browsers cached of it stay valid.
+    """
+    previous = read_manifest().get("tables", {})
+
+    print("Creating report tables ...")
+    conn = duckdb.connect()
+    conn.execute("ATTACH 'data.duckdb' as db (READ_ONLY);")
+
+    tables = {}
+    fingerprints = {}
+    summaries = {}
+    in_memory = set()
+    for table, build, inputs in REPORT_TABLES:
+        with tracing.span("report", table=table) as span:
+            fingerprints[table] = table_fingerprint(conn, build, inputs, fingerprints, summaries)
+            kept = previous.get(table, {})
+            if kept.get("fingerprint") == fingerprints[table] and os.path.exists(os.path.join(SITE_DIR, kept["file"])):
+                print(f"  {table}: inputs unchanged, keeping {kept['file']}.")
+                tables[table] = kept
+                span["kept"] = True
+                continue
+
+            for name in inputs:
+                if name in tables and name not in in_memory:
+                    load_table_file(conn, name, os.path.join(SITE_DIR, tables[name]["file"]))
+                    in_memory.add(name)
+            build(conn)
+            in_memory.add(table)
+
+            content_hash, rows = table_content_hash(conn, table)
+            file_name = f"{DB_SITE_NAME}_{table}_{content_hash}.duckdb"
+            if os.path.exists(os.path.join(SITE_DIR, file_name)):
+                print(f"  {table}: rebuilt, content unchanged, keeping {file_name}.")
+            else:
+                print(f"  {table}: rebuilt, writing {file_name}.")
+                write_table_file(conn, table, os.path.join(SITE_DIR, file_name))
+                span["bytes_written"] = os.path.getsize(os.path.join(SITE_DIR, file_name))
+            span["rows"] = rows
+            tables[table] = {
+                "file": file_name,
+                "hash": content_hash,
+                "rows": rows,
+                "fingerprint": fingerprints[table],
+            }
     conn.close()
     print("Done.")
-    
-    # Compress the database
-    compress.compress_database(db_site_path)
-    
+    blocks_read = count_blocks_read(tables)
+
+    # Remove the files no table of this generation points to
+    current_files = {info["file"] for info in tables.values()}
+    for path in glob.glob(os.path.join(SITE_DIR, f"{DB_SITE_NAME}*.duckdb")):
+        if os.path.basename(path) in current_files:
+            continue
+        try:
+            os.remove(path)
+            print(f"Removed unused report database: {path}")
+        except OSError:
+            print(f"Could not remove {path}, skipping.")
+
     # Write manifest
     manifest = {
         "generated_at": generated_at.isoformat(),
-        "db_name": os.path.basename(db_site_path),
+        "tables": tables,
+        "blocks_read": blocks_read,
     }
     manifest_path = os.path.join(SITE_DIR, DB_SITE_NAME + "_manifest.json")
     with open(manifest_path, "w") as f:
         json.dump(manifest, f, indent=2)
-    
-    return db_site_path
+
+    return manifest_path
 
 if __name__ == "__main__":
     generated_at = dt.datetime.now(dt.timezone.utc)
-    make_report_db(generated_at)
\ No newline at end of file
+    make_report_db(generated_at)
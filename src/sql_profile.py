@@ -0,0 +1,118 @@
+"""
+Opt-in DuckDB profiling of the heavy statements: the import scans and INSERTs, the station_latest
+MERGEs and the largest report tables.
+
+go.py --profile-sql turns it on for a run. Every statement run through execute() then writes
+DuckDB's JSON profile (the plan with per-operator timing and cardinality) to
+profiles/<run id>/<statement>.json. Without it, execute() is a plain conn.execute().
+
+    python sql_profile.py [--runs N] [--top N] [--statement PREFIX]
+
+prints the operators that took the most time across the last runs.
+"""
+import argparse
+import json
+import os
+import re
+import threading
+from collections import defaultdict
+
+from constants import DIR_SQL_PROFILES
+
+enabled = False
+run_id = None
+_seen = defaultdict(int)
+_seen_lock = threading.Lock()
+
+
+def start(new_run_id):
+    """Profile the statements from now on, under new_run_id."""
+    global enabled, run_id
+    enabled, run_id = True, new_run_id
+    os.makedirs(os.path.join(DIR_SQL_PROFILES, run_id), exist_ok=True)
+
+
+def profile_path(name):
+    # statements that run more than once per run (one import per batch) get numbered
+    with _seen_lock:
+        _seen[name] += 1
+        n = _seen[name]
+    return os.path.join(DIR_SQL_PROFILES, run_id, f"{name}.json" if n == 1 else f"{name}-{n}.json")
+
+
+def execute(conn, name, sql, params=None):
+    """conn.execute(sql, params).fetchall(), with the JSON profile saved as name when profiling is on."""
+    if not enabled:
+        return conn.execute(sql, params).fetchall()
+    # settings are per connection, so concurrent cursors each profile their own statements
+    conn.execute("SET enable_profiling = 'json';")
+    conn.execute(f"SET profiling_output = '{profile_path(name)}';")
+    try:
+        return conn.execute(sql, params).fetchall()
+    finally:
+        conn.execute("PRAGMA disable_profiling;")
+
+
+def operators(node):
+    """(operator, seconds, rows) of every operator in a profile tree."""
+    for child in node.get("children", []):
+        name = child.get("operator_name") or child.get("operator_type")
+        table = child.get("extra_info", {}).get("Table")
+        if table:
+            name = f"{name} {table}"
+        yield name, child.get("operator_timing", 0.0), child.get("operator_cardinality", 0)
+        yield from operators(child)
+
+
+def summarize(runs=5, top=20, statement=None):
+    """Print the operators with the most time over the last runs, per statement."""
+    if not os.path.isdir(DIR_SQL_PROFILES):
+        print(f"No profiles in {DIR_SQL_PROFILES}, run go.py with --profile-sql first.")
+        return
+    run_ids = sorted(d for d in os.listdir(DIR_SQL_PROFILES) if os.path.isdir(os.path.join(DIR_SQL_PROFILES, d)))[-runs:]
+
+    totals = defaultdict(lambda: {"seconds": 0.0, "rows": 0, "calls": 0})
+    statement_seconds = defaultdict(float)
+    for rid in run_ids:
+        run_dir = os.path.join(DIR_SQL_PROFILES, rid)
+        for fname in sorted(os.listdir(run_dir)):
+            if not fname.endswith(".json"):
+                continue
+            name = re.sub(r"-\d+$", "", fname.removesuffix(".json"))
+            if statement and not name.startswith(statement):
+                continue
+            try:
+                with open(os.path.join(run_dir, fname)) as f:
+                    profile = json.load(f)
+            except (OSError, ValueError):
+                print(f"Skipping unreadable profile {rid}/{fname}.")
+                continue
+            statement_seconds[name] += profile.get("latency", 0.0)
+            for operator, seconds, rows in operators(profile):
+                entry = totals[(name, operator)]
+                entry["seconds"] += seconds
+                entry["rows"] += rows
+                entry["calls"] += 1
+
+    if not totals:
+        print("No matching profiles.")
+        return
+    all_seconds = sum(entry["seconds"] for entry in totals.values()) or 1e-9
+    print(f"Hottest operators over {len(run_ids)} runs ({run_ids[0]} .. {run_ids[-1]}), "
+          f"{sum(statement_seconds.values()):.1f}s in {len(statement_seconds)} statements:")
+    print(f"{'time':>10} {'share':>6} {'calls':>6} {'rows':>14}  statement / operator")
+    for (name, operator), entry in sorted(totals.items(), key=lambda item: -item[1]["seconds"])[:top]:
+        print(f"{entry['seconds']:9.3f}s {entry['seconds'] / all_seconds:6.1%} {entry['calls']:6} {entry['rows']:14,}  {name} / {operator}")
+
+    print("\nStatements by latency:")
+    for name, seconds in sorted(statement_seconds.items(), key=lambda item: -item[1]):
+        print(f"{seconds:9.3f}s  {name}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize the hottest DuckDB operators of the profiled runs.")
+    parser.add_argument('--runs', '-r', type=int, default=5, help='Number of most recent runs to include (default: 5)')
+    parser.add_argument('--top', '-n', type=int, default=20, help='Number of operators to show (default: 20)')
+    parser.add_argument('--statement', '-s', default=None, help='Only statements whose name starts with this, e.g. import_jump')
+    args = parser.parse_args()
+    summarize(runs=args.runs, top=args.top, statement=args.statement)
@@ -0,0 +1,136 @@
+"""
+Spans around the stages of a run, written out as a JSON trace and an OpenMetrics text file.
+
+    with tracing.span("report", table="systems") as s:
+        ...
+        s["rows"] = rows
+
+A span records its start and duration, the peak RSS of the process when it ends, and the rows,
+bytes_read and bytes_written the code inside it fills in. tracing.record() adds to the innermost
+span open on the current thread, for code that does not hold the span itself. Spans opened on
+other threads (the worker pools of dl_today, dl_hist and extract) have no parent, but their
+start times place them within the stage that started them.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, where peak RSS is left out
+    resource = None
+
+COUNTERS = ("rows", "bytes_read", "bytes_written")
+
+spans = []
+_spans_lock = threading.Lock()
+_local = threading.local()
+
+
+def peak_rss_bytes():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+@contextmanager
+def span(name, **labels):
+    """Time the block as a span called name; labels (table, file, ...) tell spans of the same name apart."""
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    current = {
+        "name": name,
+        "labels": {key: str(value) for key, value in labels.items()},
+        "parent": stack[-1]["name"] if stack else None,
+        "thread": threading.current_thread().name,
+        "start": time.time(),
+    }
+    stack.append(current)
+    start = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current["error"] = repr(e)
+        raise
+    finally:
+        current["seconds"] = time.perf_counter() - start
+        current["peak_rss_bytes"] = peak_rss_bytes()
+        stack.pop()
+        with _spans_lock:
+            spans.append(current)
+
+
+def record(**counts):
+    """Add counts (rows, bytes_read, bytes_written) to the innermost span open on this thread, if any."""
+    stack = getattr(_local, "stack", None)
+    if stack:
+        for key, value in counts.items():
+            if value is not None:
+                stack[-1][key] = stack[-1].get(key, 0) + value
+
+
+def escape_label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def metric_labels(s):
+    labels = {"span": s["name"], **s["labels"]}
+    return ",".join(f'{key}="{escape_label(value)}"' for key, value in sorted(labels.items()))
+
+
+def openmetrics(finished):
+    """The spans as OpenMetrics text; spans with the same name and labels are added up (peak RSS: max)."""
+    samples = {}
+    for s in finished:
+        labels = metric_labels(s)
+        sample = samples.setdefault(labels, {"count": 0, "seconds": 0.0})
+        sample["count"] += 1
+        sample["seconds"] += s["seconds"]
+        for key in COUNTERS:
+            if key in s:
+                sample[key] = sample.get(key, 0) + s[key]
+        if s["peak_rss_bytes"] is not None:
+            sample["peak_rss_bytes"] = max(sample.get("peak_rss_bytes", 0), s["peak_rss_bytes"])
+
+    metrics = [
+        ("pipeline_span_seconds", "counter", "Time spent in the span.", "seconds"),
+        ("pipeline_span_calls", "counter", "Number of times the span ran.", "count"),
+        ("pipeline_span_rows", "counter", "Rows read or written in the span.", "rows"),
+        ("pipeline_span_read_bytes", "counter", "Bytes read in the span.", "bytes_read"),
+        ("pipeline_span_written_bytes", "counter", "Bytes written in the span.", "bytes_written"),
+        ("pipeline_span_peak_rss_bytes", "gauge", "Peak resident set size of the process at the end of the span.", "peak_rss_bytes"),
+    ]
+    lines = []
+    for metric, kind, help_text, key in metrics:
+        values = [(labels, sample[key]) for labels, sample in samples.items() if key in sample]
+        if not values:
+            continue
+        lines.append(f"# TYPE {metric} {kind}")
+        lines.append(f"# HELP {metric} {help_text}")
+        for labels, value in values:
+            lines.append(f"{metric}{'_total' if kind == 'counter' else ''}{{{labels}}} {value}")
+    lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+
+def write_run(directory, run_id):
+    """Write the spans so far to <directory>/trace_<run_id>.json and metrics_<run_id>.txt, reset and return them."""
+    with _spans_lock:
+        finished = sorted(spans, key=lambda s: s["start"])
+        spans.clear()
+    os.makedirs(directory, exist_ok=True)
+    trace_path = os.path.join(directory, f"trace_{run_id}.json")
+    with open(trace_path, "w") as f:
+        json.dump({"run_id": run_id, "spans": finished}, f, indent=2)
+    metrics_path = os.path.join(directory, f"metrics_{run_id}.txt")
+    with open(metrics_path, "w") as f:
+        f.write(openmetrics(finished))
+    print(f"Wrote {trace_path} and {metrics_path}.")
+    return finished
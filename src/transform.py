@@ -1,12 +1,17 @@
 """
-Transform: Materialize station_latest table for performance.
+Transform: Materialize station_latest and system_latest tables for performance.
 
 Converts the deprecated station_latest view logic into a physical materialized table.
 Combines data from docked, approach_settlement, and location tables,
 taking the most recent state for each unique station.
+
+system_latest (formerly a view over jumps_location) holds the most recent state
+of each system, and is only recomputed for systems with new data.
 """
 
 from db import connect_db
+import sql_profile
+import tracing
 
 
 def materialize_station_latest():
@@ -59,166 +64,172 @@ def materialize_station_latest():
         """).fetchone()[0]
 
         # Stage 1: MERGE docked
-        print("  Merging docked...", end=" ")
-        conn.execute("""
-        MERGE INTO station_latest t
-        USING (
-            SELECT
-                arg_max(timestamp, timestamp) AS timestamp,
-                arg_max(StarSystem, timestamp) AS StarSystem,
-                SystemAddress,
-                StationName,
-                arg_max(StationType, timestamp) AS StationType,
-                arg_max(MarketId, timestamp) AS MarketId,
-                arg_max(DistFromStarLS, timestamp) AS DistFromStarLS,
-                arg_max(StarPos, timestamp) AS StarPos,
-                arg_max(StationAllegiance, timestamp) AS StationAllegiance,
-                arg_max(StationEconomies, timestamp) AS StationEconomies,
-                arg_max(StationEconomy, timestamp) AS StationEconomy,
-                arg_max(StationFaction, timestamp) AS StationFaction,
-                arg_max(StationGovernment, timestamp) AS StationGovernment,
-                arg_max(StationServices, timestamp) AS StationServices,
-                arg_max(LandingPads, timestamp) AS LandingPads
-            FROM docked
-            WHERE timestamp > ?
-            GROUP BY SystemAddress, StationName
-        ) s
-        ON t.SystemAddress = s.SystemAddress
-           AND t.StationName = s.StationName
-        WHEN MATCHED AND s.timestamp > t.timestamp THEN
-            UPDATE SET
-                timestamp = s.timestamp,
-                StarSystem = s.StarSystem,
-                StationType = s.StationType,
-                MarketId = s.MarketId,
-                DistFromStarLS = s.DistFromStarLS,
-                StarPos = s.StarPos,
-                StationAllegiance = s.StationAllegiance,
-                StationEconomies = s.StationEconomies,
-                StationEconomy = s.StationEconomy,
-                StationFaction = s.StationFaction,
-                StationGovernment = s.StationGovernment,
-                StationServices = s.StationServices,
-                LandingPads = s.LandingPads
-        WHEN MATCHED AND t.LandingPads IS NULL AND s.LandingPads IS NOT NULL THEN
-            UPDATE SET
-                LandingPads = s.LandingPads
-        WHEN NOT MATCHED THEN
-            INSERT VALUES (
-                s.timestamp, s.StarSystem, s.SystemAddress, s.StationName, s.StationType,
-                s.MarketId, s.DistFromStarLS, s.StarPos, s.StationAllegiance,
-                s.StationEconomies, s.StationEconomy, s.StationFaction,
-                s.StationGovernment, s.StationServices, s.LandingPads
-            )
-        """, [cutoff])
-        count = conn.execute("SELECT COUNT(*) FROM station_latest").fetchone()[0]
-        print(f"✓ ({count:,})")
+        with tracing.span("transform", table="station_latest", source="docked"):
+            print("  Merging docked...", end=" ")
+            merged = sql_profile.execute(conn, "merge_station_latest_docked", """
+            MERGE INTO station_latest t
+            USING (
+                SELECT
+                    arg_max(timestamp, timestamp) AS timestamp,
+                    arg_max(StarSystem, timestamp) AS StarSystem,
+                    SystemAddress,
+                    StationName,
+                    arg_max(StationType, timestamp) AS StationType,
+                    arg_max(MarketId, timestamp) AS MarketId,
+                    arg_max(DistFromStarLS, timestamp) AS DistFromStarLS,
+                    arg_max(StarPos, timestamp) AS StarPos,
+                    arg_max(StationAllegiance, timestamp) AS StationAllegiance,
+                    arg_max(StationEconomies, timestamp) AS StationEconomies,
+                    arg_max(StationEconomy, timestamp) AS StationEconomy,
+                    arg_max(StationFaction, timestamp) AS StationFaction,
+                    arg_max(StationGovernment, timestamp) AS StationGovernment,
+                    arg_max(StationServices, timestamp) AS StationServices,
+                    arg_max(LandingPads, timestamp) AS LandingPads
+                FROM docked
+                WHERE timestamp > ?
+                GROUP BY SystemAddress, StationName
+            ) s
+            ON t.SystemAddress = s.SystemAddress
+               AND t.StationName = s.StationName
+            WHEN MATCHED AND s.timestamp > t.timestamp THEN
+                UPDATE SET
+                    timestamp = s.timestamp,
+                    StarSystem = s.StarSystem,
+                    StationType = s.StationType,
+                    MarketId = s.MarketId,
+                    DistFromStarLS = s.DistFromStarLS,
+                    StarPos = s.StarPos,
+                    StationAllegiance = s.StationAllegiance,
+                    StationEconomies = s.StationEconomies,
+                    StationEconomy = s.StationEconomy,
+                    StationFaction = s.StationFaction,
+                    StationGovernment = s.StationGovernment,
+                    StationServices = s.StationServices,
+                    LandingPads = s.LandingPads
+            WHEN MATCHED AND t.LandingPads IS NULL AND s.LandingPads IS NOT NULL THEN
+                UPDATE SET
+                    LandingPads = s.LandingPads
+            WHEN NOT MATCHED THEN
+                INSERT VALUES (
+                    s.timestamp, s.StarSystem, s.SystemAddress, s.StationName, s.StationType,
+                    s.MarketId, s.DistFromStarLS, s.StarPos, s.StationAllegiance,
+                    s.StationEconomies, s.StationEconomy, s.StationFaction,
+                    s.StationGovernment, s.StationServices, s.LandingPads
+                )
+            """, [cutoff])[0][0]
+            tracing.record(rows=merged)
+            count = conn.execute("SELECT COUNT(*) FROM station_latest").fetchone()[0]
+            print(f"✓ ({count:,})")
         
         # Stage 2: MERGE approach_settlement
-        print("  Merging approach_settlement...", end=" ")
-        conn.execute("""
-        MERGE INTO station_latest t
-        USING (
-            SELECT
-                arg_max(timestamp, timestamp) AS timestamp,
-                arg_max(StarSystem, timestamp) AS StarSystem,
-                SystemAddress,
-                Name AS StationName,
-                'Empty' AS StationType,
-                arg_max(MarketId, timestamp) AS MarketId,
-                NULL AS DistFromStarLS,
-                arg_max(StarPos, timestamp) AS StarPos,
-                arg_max(StationAllegiance, timestamp) AS StationAllegiance,
-                arg_max(StationEconomies, timestamp) AS StationEconomies,
-                arg_max(StationEconomy, timestamp) AS StationEconomy,
-                arg_max(StationFaction, timestamp) AS StationFaction,
-                arg_max(StationGovernment, timestamp) AS StationGovernment,
-                arg_max(StationServices, timestamp) AS StationServices,
-                NULL AS LandingPads
-            FROM approach_settlement
-            WHERE timestamp > ?
-            GROUP BY SystemAddress, Name
-        ) s
-        ON t.SystemAddress = s.SystemAddress 
-           AND t.StationName = s.StationName
-        WHEN MATCHED AND s.timestamp > t.timestamp THEN
-            UPDATE SET 
-                timestamp = s.timestamp,
-                StarSystem = s.StarSystem,
-                StationType = s.StationType,
-                MarketId = s.MarketId,
-                DistFromStarLS = s.DistFromStarLS,
-                StarPos = s.StarPos,
-                StationAllegiance = s.StationAllegiance,
-                StationEconomies = s.StationEconomies,
-                StationEconomy = s.StationEconomy,
-                StationFaction = s.StationFaction,
-                StationGovernment = s.StationGovernment,
-                StationServices = s.StationServices,
-                LandingPads = COALESCE(t.LandingPads, s.LandingPads)
-        WHEN NOT MATCHED THEN
-            INSERT VALUES (
-                s.timestamp, s.StarSystem, s.SystemAddress, s.StationName, s.StationType,
-                s.MarketId, s.DistFromStarLS, s.StarPos, s.StationAllegiance,
-                s.StationEconomies, s.StationEconomy, s.StationFaction,
-                s.StationGovernment, s.StationServices, s.LandingPads
-            )
-        """, [cutoff])
-        count = conn.execute("SELECT COUNT(*) FROM station_latest").fetchone()[0]
-        print(f"✓ ({count:,} total)")
+        with tracing.span("transform", table="station_latest", source="approach_settlement"):
+            print("  Merging approach_settlement...", end=" ")
+            merged = sql_profile.execute(conn, "merge_station_latest_approach_settlement", """
+            MERGE INTO station_latest t
+            USING (
+                SELECT
+                    arg_max(timestamp, timestamp) AS timestamp,
+                    arg_max(StarSystem, timestamp) AS StarSystem,
+                    SystemAddress,
+                    Name AS StationName,
+                    'Empty' AS StationType,
+                    arg_max(MarketId, timestamp) AS MarketId,
+                    NULL AS DistFromStarLS,
+                    arg_max(StarPos, timestamp) AS StarPos,
+                    arg_max(StationAllegiance, timestamp) AS StationAllegiance,
+                    arg_max(StationEconomies, timestamp) AS StationEconomies,
+                    arg_max(StationEconomy, timestamp) AS StationEconomy,
+                    arg_max(StationFaction, timestamp) AS StationFaction,
+                    arg_max(StationGovernment, timestamp) AS StationGovernment,
+                    arg_max(StationServices, timestamp) AS StationServices,
+                    NULL AS LandingPads
+                FROM approach_settlement
+                WHERE timestamp > ?
+                GROUP BY SystemAddress, Name
+            ) s
+            ON t.SystemAddress = s.SystemAddress 
+               AND t.StationName = s.StationName
+            WHEN MATCHED AND s.timestamp > t.timestamp THEN
+                UPDATE SET 
+                    timestamp = s.timestamp,
+                    StarSystem = s.StarSystem,
+                    StationType = s.StationType,
+                    MarketId = s.MarketId,
+                    DistFromStarLS = s.DistFromStarLS,
+                    StarPos = s.StarPos,
+                    StationAllegiance = s.StationAllegiance,
+                    StationEconomies = s.StationEconomies,
+                    StationEconomy = s.StationEconomy,
+                    StationFaction = s.StationFaction,
+                    StationGovernment = s.StationGovernment,
+                    StationServices = s.StationServices,
+                    LandingPads = COALESCE(t.LandingPads, s.LandingPads)
+            WHEN NOT MATCHED THEN
+                INSERT VALUES (
+                    s.timestamp, s.StarSystem, s.SystemAddress, s.StationName, s.StationType,
+                    s.MarketId, s.DistFromStarLS, s.StarPos, s.StationAllegiance,
+                    s.StationEconomies, s.StationEconomy, s.StationFaction,
+                    s.StationGovernment, s.StationServices, s.LandingPads
+                )
+            """, [cutoff])[0][0]
+            tracing.record(rows=merged)
+            count = conn.execute("SELECT COUNT(*) FROM station_latest").fetchone()[0]
+            print(f"✓ ({count:,} total)")
         
         # Stage 3: MERGE location (docked only)
-        print("  Merging location...", end=" ")
-        conn.execute("""
-        MERGE INTO station_latest t
-        USING (
-            SELECT
-                arg_max(timestamp, timestamp) AS timestamp,
-                arg_max(StarSystem, timestamp) AS StarSystem,
-                SystemAddress,
-                StationName,
-                arg_max(StationType, timestamp) AS StationType,
-                arg_max(MarketId, timestamp) AS MarketId,
-                arg_max(DistFromStarLS, timestamp) AS DistFromStarLS,
-                arg_max(StarPos, timestamp) AS StarPos,
-                NULL AS StationAllegiance,
-                arg_max(StationEconomies, timestamp) AS StationEconomies,
-                arg_max(StationEconomy, timestamp) AS StationEconomy,
-                arg_max(StationFaction, timestamp) AS StationFaction,
-                arg_max(StationGovernment, timestamp) AS StationGovernment,
-                arg_max(StationServices, timestamp) AS StationServices,
-                NULL AS LandingPads
-            FROM location
-            WHERE Docked = TRUE AND StationName IS NOT NULL AND timestamp > ?
-            GROUP BY SystemAddress, StationName
-        ) s
-        ON t.SystemAddress = s.SystemAddress 
-           AND t.StationName = s.StationName
-        WHEN MATCHED AND s.timestamp > t.timestamp THEN
-            UPDATE SET 
-                timestamp = s.timestamp,
-                StarSystem = s.StarSystem,
-                StationType = s.StationType,
-                MarketId = s.MarketId,
-                DistFromStarLS = s.DistFromStarLS,
-                StarPos = s.StarPos,
-                StationAllegiance = s.StationAllegiance,
-                StationEconomies = s.StationEconomies,
-                StationEconomy = s.StationEconomy,
-                StationFaction = s.StationFaction,
-                StationGovernment = s.StationGovernment,
-                StationServices = s.StationServices,
-                LandingPads = COALESCE(t.LandingPads, s.LandingPads)
-        WHEN NOT MATCHED THEN
-            INSERT VALUES (
-                s.timestamp, s.StarSystem, s.SystemAddress, s.StationName, s.StationType,
-                s.MarketId, s.DistFromStarLS, s.StarPos, s.StationAllegiance,
-                s.StationEconomies, s.StationEconomy, s.StationFaction,
-                s.StationGovernment, s.StationServices, s.LandingPads
-            )
-        """, [cutoff])
-        count = conn.execute("SELECT COUNT(*) FROM station_latest").fetchone()[0]
-        print(f"✓ ({count:,} total)")
+        with tracing.span("transform", table="station_latest", source="location"):
+            print("  Merging location...", end=" ")
+            merged = sql_profile.execute(conn, "merge_station_latest_location", """
+            MERGE INTO station_latest t
+            USING (
+                SELECT
+                    arg_max(timestamp, timestamp) AS timestamp,
+                    arg_max(StarSystem, timestamp) AS StarSystem,
+                    SystemAddress,
+                    StationName,
+                    arg_max(StationType, timestamp) AS StationType,
+                    arg_max(MarketId, timestamp) AS MarketId,
+                    arg_max(DistFromStarLS, timestamp) AS DistFromStarLS,
+                    arg_max(StarPos, timestamp) AS StarPos,
+                    NULL AS StationAllegiance,
+                    arg_max(StationEconomies, timestamp) AS StationEconomies,
+                    arg_max(StationEconomy, timestamp) AS StationEconomy,
+                    arg_max(StationFaction, timestamp) AS StationFaction,
+                    arg_max(StationGovernment, timestamp) AS StationGovernment,
+                    arg_max(StationServices, timestamp) AS StationServices,
+                    NULL AS LandingPads
+                FROM location
+                WHERE Docked = TRUE AND StationName IS NOT NULL AND timestamp > ?
+                GROUP BY SystemAddress, StationName
+            ) s
+            ON t.SystemAddress = s.SystemAddress 
+               AND t.StationName = s.StationName
+            WHEN MATCHED AND s.timestamp > t.timestamp THEN
+                UPDATE SET 
+                    timestamp = s.timestamp,
+                    StarSystem = s.StarSystem,
+                    StationType = s.StationType,
+                    MarketId = s.MarketId,
+                    DistFromStarLS = s.DistFromStarLS,
+                    StarPos = s.StarPos,
+                    StationAllegiance = s.StationAllegiance,
+                    StationEconomies = s.StationEconomies,
+                    StationEconomy = s.StationEconomy,
+                    StationFaction = s.StationFaction,
+                    StationGovernment = s.StationGovernment,
+                    StationServices = s.StationServices,
+                    LandingPads = COALESCE(t.LandingPads, s.LandingPads)
+            WHEN NOT MATCHED THEN
+                INSERT VALUES (
+                    s.timestamp, s.StarSystem, s.SystemAddress, s.StationName, s.StationType,
+                    s.MarketId, s.DistFromStarLS, s.StarPos, s.StationAllegiance,
+                    s.StationEconomies, s.StationEconomy, s.StationFaction,
+                    s.StationGovernment, s.StationServices, s.LandingPads
+                )
+            """, [cutoff])[0][0]
+            tracing.record(rows=merged)
+            count = conn.execute("SELECT COUNT(*) FROM station_latest").fetchone()[0]
+            print(f"✓ ({count:,} total)")
         
         conn.close()
         
@@ -228,8 +239,70 @@ def materialize_station_latest():
         raise
 
 
+def system_latest_query(where):
+    return f"""
+    SELECT 
+        SystemAddress, 
+        -- for all the "normal" columns, just take the most recent value.
+        first(COLUMNS(* EXCLUDE (SystemAddress, timestamp, PowerplayStateControlProgress, PowerplayStateReinforcement, PowerplayStateUndermining)) ORDER BY timestamp DESC),
+        -- some Powerplay columns may be inexplicably NULL, so we use any_value() to get the most recent non-NULL value in that case.
+        any_value(COLUMNS(['PowerplayStateControlProgress', 'PowerplayStateReinforcement', 'PowerplayStateUndermining']) ORDER BY timestamp DESC),
+        MAX(timestamp) AS timestamp,
+        first(timestamp ORDER BY timestamp DESC) FILTER (PowerplayStateControlProgress IS NOT NULL) AS PowerplayTimestamp
+    FROM jumps_location
+    WHERE {where}
+    GROUP BY SystemAddress
+    """
+
+
+def materialize_system_latest():
+    """
+    Create materialized system_latest table from jumps_location.
+    Systems with rows newer than the watermark are recomputed from their whole
+    history and upserted, so the most recent non-NULL Powerplay progress is kept
+    even when the new rows don't have one.
+    Key: SystemAddress.
+    """
+    conn = connect_db()
+
+    print("Materializing system_latest...", end=" ")
+
+    try:
+        conn.execute(f"CREATE TABLE IF NOT EXISTS system_latest AS {system_latest_query('1 = 0')}")
+        try:
+            conn.execute("""
+            ALTER TABLE system_latest
+            ADD PRIMARY KEY (SystemAddress)
+            """)
+        except Exception:
+            pass
+
+        cutoff = conn.execute("""
+        SELECT COALESCE(
+            MAX(timestamp) - INTERVAL '1 hour',
+            TIMESTAMP '1970-01-01'
+        )
+        FROM system_latest
+        """).fetchone()[0]
+
+        touched = "SystemAddress IN (SELECT SystemAddress FROM jumps_location WHERE timestamp > ?)"
+        with tracing.span("transform", table="system_latest", source="jumps_location"):
+            merged = conn.execute(f"INSERT OR REPLACE INTO system_latest {system_latest_query(touched)}", [cutoff]).fetchone()[0]
+            tracing.record(rows=merged)
+        count = conn.execute("SELECT COUNT(*) FROM system_latest").fetchone()[0]
+        print(f"✓ ({count:,})")
+
+        conn.close()
+
+    except Exception as e:
+        print(f"✗ Error materializing system_latest: {e}")
+        conn.close()
+        raise
+
+
 def main():
     materialize_station_latest()
+    materialize_system_latest()
 
 
 if __name__ == "__main__":
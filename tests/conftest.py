@@ -0,0 +1,23 @@
+import threading
+from functools import partial
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from localhttp import CORSRangeRequestHandler
+
+
+@pytest.fixture
+def remote(tmp_path):
+    """A local range-capable server standing in for edgalaxydata.space, serving tmp_path/remote."""
+    remote_dir = tmp_path / "remote"
+    remote_dir.mkdir()
+    handler = partial(CORSRangeRequestHandler, directory=str(remote_dir))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield remote_dir, f"http://127.0.0.1:{server.server_address[1]}/"
+    finally:
+        server.shutdown()
+        thread.join(timeout=2)
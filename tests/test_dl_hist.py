@@ -0,0 +1,45 @@
+import bz2
+import datetime as dt
+import gzip
+
+import dl_hist
+
+DAY = dt.date(2025, 1, 1)
+DAY_LINES = b"".join(b'{"line": %d}\n' % i for i in range(2000))
+
+
+def setup_day(remote, tmp_path, monkeypatch, local_bytes):
+    """The finished day on the remote (plain and archived) and a partial local copy of it."""
+    remote_dir, base_url = remote
+    monkeypatch.setattr(dl_hist, "URL_BASE_EDGALAXYDATA", base_url)
+    monkeypatch.setattr(dl_hist, "DIR_DATA_DUMP", str(tmp_path / "dump"))
+    (tmp_path / "dump").mkdir()
+    (remote_dir / "2025-01").mkdir()
+    (remote_dir / "Commodity-2025-01-01.jsonl").write_bytes(DAY_LINES)
+    (remote_dir / "2025-01" / "Commodity-2025-01-01.jsonl.bz2").write_bytes(bz2.compress(DAY_LINES))
+    local_file = tmp_path / "dump" / "Commodity-2025-01-01.jsonl"
+    local_file.write_bytes(local_bytes)
+    return local_file
+
+
+def test_partial_day_gets_only_its_tail(remote, tmp_path, monkeypatch):
+    local_file = setup_day(remote, tmp_path, monkeypatch, DAY_LINES[:20000])
+
+    status, path, downloaded = dl_hist.download_daily_file("Commodity", DAY)
+    assert (status, path, downloaded) == (206, str(local_file), len(DAY_LINES) - 20000)
+    assert local_file.read_bytes() == DAY_LINES
+
+    dl_hist.transcode_daily_file(path)
+    assert not local_file.exists()
+    assert gzip.decompress((tmp_path / "dump" / "Commodity-2025-01-01.jsonl.gz").read_bytes()) == DAY_LINES
+
+
+def test_mismatching_day_falls_back_to_archive(remote, tmp_path, monkeypatch):
+    local_file = setup_day(remote, tmp_path, monkeypatch, b'{"other": 1}\n' * 2000)
+
+    status, path, _ = dl_hist.download_daily_file("Commodity", DAY)
+    assert (status, path) == (200, str(tmp_path / "dump" / "Commodity-2025-01-01.jsonl.bz2"))
+
+    dl_hist.transcode_daily_file(path)
+    assert not local_file.exists()
+    assert gzip.decompress((tmp_path / "dump" / "Commodity-2025-01-01.jsonl.gz").read_bytes()) == DAY_LINES
@@ -0,0 +1,36 @@
+import dl_today
+import http_client
+
+
+def test_download_incremental_appends_only_new_bytes(remote, tmp_path):
+    remote_dir, base_url = remote
+    remote_file = remote_dir / "Journal.FSDJump-2025-01-01.jsonl"
+    local_file = tmp_path / "local" / "Journal.FSDJump-2025-01-01.jsonl"
+    http_client.timings.clear()
+
+    remote_file.write_bytes(b'{"a": 1}\n')
+    dl_today.download_incremental(base_url + remote_file.name, str(local_file))
+    assert local_file.read_bytes() == b'{"a": 1}\n'
+
+    with open(remote_file, "ab") as f:
+        f.write(b'{"a": 2}\n')
+    dl_today.download_incremental(base_url + remote_file.name, str(local_file))
+    assert local_file.read_bytes() == remote_file.read_bytes()
+
+    # Nothing new: a single 416 request, the local file stays as it is
+    dl_today.download_incremental(base_url + remote_file.name, str(local_file))
+    assert local_file.read_bytes() == remote_file.read_bytes()
+
+    assert [t["status"] for t in http_client.timings] == [200, 206, 416]
+    assert [t["bytes"] for t in http_client.timings] == [9, 9, 0]
+
+
+def test_download_incremental_drops_local_file_when_remote_shrinks(remote, tmp_path):
+    remote_dir, base_url = remote
+    remote_file = remote_dir / "Commodity-2025-01-01.jsonl"
+    local_file = tmp_path / "Commodity-2025-01-01.jsonl"
+
+    remote_file.write_bytes(b'{"a": 1}\n')
+    local_file.write_bytes(b'{"a": 1}\n{"a": 2}\n')
+    dl_today.download_incremental(base_url + remote_file.name, str(local_file))
+    assert not local_file.exists()
@@ -0,0 +1,28 @@
+import datetime as dt
+
+import duckdb
+
+import extract
+
+START = dt.datetime(2025, 9, 2, 8, 0)
+
+
+def test_duplicates_are_dropped_but_sightings_are_kept():
+    conn = duckdb.connect()
+    conn.execute("CREATE TABLE jumps (timestamp TIMESTAMP, ContentHash UBIGINT)")
+    conn.execute("CREATE TEMP TABLE tmp_extracted (filename VARCHAR, rn BIGINT, timestamp TIMESTAMP, ContentHash UBIGINT)")
+    # An unchanged system seen every 5 minutes for 3 hours, each sighting relayed twice
+    for i in range(36):
+        ts = START + dt.timedelta(minutes=5 * i)
+        conn.execute("INSERT INTO tmp_extracted VALUES ('jump.jsonl', ?, ?, 1), ('jump.jsonl', ?, ?, 1)", [2 * i + 1, ts, 2 * i + 2, ts])
+    # and a copy of an event that is already stored
+    conn.execute("INSERT INTO jumps VALUES (?, 2)", [START])
+    conn.execute("INSERT INTO tmp_extracted VALUES ('jump.jsonl', 100, ?, 2)", [START + dt.timedelta(seconds=30)])
+
+    batch = [("Journal.FSDJump-2025-09-02.jsonl", 0, {"path": "jump.jsonl"})]
+    dropped = extract.drop_duplicate_rows(conn, "jumps", batch, window_seconds=600)
+
+    kept = [row[0] for row in conn.execute("SELECT timestamp FROM tmp_extracted ORDER BY timestamp").fetchall()]
+    # the first sighting, then one each time the last kept one is more than the window ago
+    assert kept == [START + dt.timedelta(minutes=15 * i) for i in range(12)]
+    assert dropped == {"Journal.FSDJump-2025-09-02.jsonl": 73 - len(kept)}